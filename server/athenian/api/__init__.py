@@ -57,6 +57,14 @@ def parse_args() -> argparse.Namespace:
   ATHENIAN_INVITATION_KEY  Passphrase to encrypt the invitation links
   ATHENIAN_INVITATION_URL_PREFIX
                            String with which any invitation URL starts, e.g. https://app.athenian.co/i/
+  ATHENIAN_CACHE_MAX_ITEM_SIZE
+                           Values bigger than this number of bytes are split into several memcached items (default: 1000000)
+  ATHENIAN_MINER_PARALLEL_QUERIES
+                           Maximum number of concurrent metadata DB queries while mining PRs (default: 4)
+  ATHENIAN_MINER_CACHE_COMPRESSION
+                           Compression of the cached PRs: lz4, zstd or empty for none (default: lz4)
+  ATHENIAN_PARALLEL_FOR_SETS
+                           Maximum number of "for" sets evaluated concurrently in one metrics request (default: 4)
   """,  # noqa
                                      formatter_class=Formatter)
     add_logging_args(parser)
@@ -1,17 +1,25 @@
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 import math
-from typing import Sequence, Union
+from typing import AsyncIterator, List, Mapping, Optional, Sequence, Tuple, Union
 
 import databases
+import numpy as np
 from numpy import datetime64
 import pandas as pd
+from sqlalchemy import ARRAY, Boolean, DateTime, Float, Integer, Numeric
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.sql import ClauseElement
+from sqlalchemy.sql.type_api import TypeEngine
 
 from athenian.api.models.metadata.github import Base as MetadataBase
 from athenian.api.models.state.models import Base as StateBase
 
 
+# How many rows we decode at once by default.
+CHUNK_SIZE = 10000
+
+
 async def read_sql_query(sql: ClauseElement,
                          con: Union[databases.Database, databases.core.Connection],
                          columns: Union[Sequence[str], Sequence[InstrumentedAttribute],
@@ -37,16 +45,104 @@ async def read_sql_query(sql: ClauseElement,
     -----
     Any datetime values with time zone information parsed via the `parse_dates`
     parameter will be converted to UTC.
+
+    If the column types are known (`columns` are column objects or the model), we decode the
+    fetched records chunk by chunk into preallocated typed numpy arrays.
     """
-    data = await con.fetch_all(query=sql)
+    names, types = _resolve_columns(columns)
+    records = await con.fetch_all(query=sql)
+    if types is None:
+        return _records_to_frame(records, names, types)
+    return _decode_in_chunks(records, names, types)
+
+
+@asynccontextmanager
+async def read_sql_query_chunked(sql: ClauseElement,
+                                 con: Union[databases.Database, databases.core.Connection],
+                                 columns: Union[Sequence[str], Sequence[InstrumentedAttribute],
+                                                MetadataBase, StateBase],
+                                 chunk_size: Optional[int] = None,
+                                 ) -> AsyncIterator[AsyncIterator[pd.DataFrame]]:
+    """Read SQL query into a series of DataFrames with at most `chunk_size` rows each.
+
+    The rows are iterated with `con.iterate()`, so only one chunk of the records is held in
+    memory at a time. If the result set is empty, we yield a single empty DataFrame.
+
+    The connection is busy inside the context: do not run other queries on it there. Leaving
+    the context releases the connection even if the iteration has not finished.
+
+        async with read_sql_query_chunked(query, db, columns) as chunks:
+            async for df in chunks:
+                ...
+
+    Parameters
+    ----------
+    sql        : SQLAlchemy query object to be executed.
+    con        : async SQLAlchemy database engine.
+    columns    : list of the resulting columns names, column objects or the model if SELECT *
+    chunk_size : maximum number of rows in each DataFrame, `CHUNK_SIZE` by default.
+
+    Returns
+    -------
+    Async context manager of the async iterator of DataFrames
+    """
+    if chunk_size is None:
+        chunk_size = CHUNK_SIZE
+    assert chunk_size > 0
+    names, types = _resolve_columns(columns)
+    records = con.iterate(query=sql)
+
+    async def iterate_chunks() -> AsyncIterator[pd.DataFrame]:
+        chunk = []
+        empty = True
+        async for record in records:
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                yield _chunk_to_frame(chunk, names, types)
+                chunk = []
+                empty = False
+        if chunk or empty:
+            yield _chunk_to_frame(chunk, names, types)
+
+    chunks = iterate_chunks()
     try:
-        probe = columns[0]
-    except TypeError:
-        columns = [c.name for c in columns.__table__.columns]
-    else:
-        if not isinstance(probe, str):
-            columns = [c.key for c in columns]
-    frame = pd.DataFrame.from_records(data, columns=columns, coerce_float=True)
+        yield chunks
+    finally:
+        await chunks.aclose()
+        # exits the transaction and releases the query lock of the connection
+        await records.aclose()
+
+
+def _chunk_to_frame(records: Sequence[Mapping],
+                    names: List[str],
+                    types: Optional[List[TypeEngine]],
+                    ) -> pd.DataFrame:
+    """Build the DataFrame from one chunk of the iterated records."""
+    if types is None:
+        return _records_to_frame(records, names, types)
+    return _decode_in_chunks(records, names, types)
+
+
+def _records_to_frame(records: Sequence,
+                      names: List[str],
+                      types: Optional[List[TypeEngine]],
+                      ) -> pd.DataFrame:
+    """Build the DataFrame from the fetched records, replace the sentinel dates and set UTC."""
+    frame = pd.DataFrame.from_records(records, columns=names, coerce_float=True)
+    return _finalize_frame(frame, types)
+
+
+def _finalize_frame(frame: pd.DataFrame, types: Optional[List[TypeEngine]]) -> pd.DataFrame:
+    """Replace the sentinel dates with `NaT` and set the timezone to UTC in place.
+
+    If we know the SQL types, we convert only the timestamp columns. Otherwise, we have to scan
+    every cell for the sentinel.
+    """
+    if types is not None:
+        for name, sqltype in zip(frame.columns, types):
+            if isinstance(sqltype, DateTime):
+                frame[name] = _to_utc_datetimes(frame[name].values)
+        return frame
     frame.replace(datetime(1, 1, 1, tzinfo=timezone.utc), math.nan, inplace=True)
     for col in frame.select_dtypes(include=[datetime64]):
         try:
@@ -54,3 +150,119 @@ async def read_sql_query(sql: ClauseElement,
         except TypeError:
             continue
     return frame
+
+
+def _to_utc_datetimes(values: Union[Sequence, np.ndarray]) -> pd.DatetimeIndex:
+    """Convert the timestamps to UTC. Both NULL and the 0001-01-01 sentinel become `NaT`."""
+    if isinstance(values, np.ndarray) and values.dtype.kind == "M":
+        # pandas has already converted them, so there are no sentinels: they are out of bounds
+        return pd.DatetimeIndex(values, tz=timezone.utc)
+    # the sentinel does not fit into datetime64[ns], so "coerce" turns it into NaT together with
+    # NULL-s in one vectorized pass instead of comparing every object with the sentinel
+    return pd.to_datetime(np.asarray(values, dtype=object), utc=True, errors="coerce")
+
+
+def _resolve_columns(columns: Union[Sequence[str], Sequence[InstrumentedAttribute],
+                                    MetadataBase, StateBase],
+                     ) -> Tuple[List[str], Optional[List[TypeEngine]]]:
+    """Return the names of the columns and their SQL types if we know them."""
+    try:
+        probe = columns[0]
+    except TypeError:
+        columns = list(columns.__table__.columns)
+        return [c.name for c in columns], [c.type for c in columns]
+    if isinstance(probe, str):
+        return list(columns), None
+    return [c.key for c in columns], [c.type for c in columns]
+
+
+def _decode_in_chunks(records: Sequence[Mapping],
+                      names: List[str],
+                      types: List[TypeEngine],
+                      ) -> pd.DataFrame:
+    """Decode the records into preallocated typed columns, `CHUNK_SIZE` rows at a time.
+
+    Only one chunk of the records is transposed to Python tuples at once.
+    """
+    columns = None
+    for beg in range(0, len(records), CHUNK_SIZE):
+        chunk = records[beg:beg + CHUNK_SIZE]
+        arrays = _decode_records(_record_values(chunk), types)
+        if columns is None:
+            columns = [np.empty(len(records), dtype=arr.dtype) for arr in arrays]
+        for i, arr in enumerate(arrays):
+            if not np.can_cast(arr.dtype, columns[i].dtype):
+                # e.g., the first NULL in an integer column
+                columns[i] = columns[i].astype(np.result_type(columns[i].dtype, arr.dtype))
+            columns[i][beg:beg + len(chunk)] = arr
+    if columns is None:
+        return _assemble_frame([[] for _ in names], names, types)
+    return _assemble_frame([[column] for column in columns], names, types)
+
+
+def _record_values(records: Sequence[Mapping]) -> List[tuple]:
+    """Convert the records to tuples by the public API which applies the result processors."""
+    return [tuple(record.values()) for record in records]
+
+
+def _decode_records(records: Sequence[Sequence], types: List[TypeEngine]) -> List[np.ndarray]:
+    """Convert the fetched rows to typed numpy arrays, one per column.
+
+    Timestamps become int64 nanoseconds since the epoch in UTC, where `NaT` substitutes both NULL
+    and the 0001-01-01 sentinel.
+    """
+    if not records:
+        values = [()] * len(types)
+    elif any(isinstance(t, ARRAY) for t in types):
+        # numpy would unroll the lists into extra dimensions
+        values = list(zip(*records))
+    else:
+        # transpose in C without allocating a tuple per column
+        table = np.array(records, dtype=object)
+        values = [table[:, i] for i in range(len(types))]
+    return [_decode_column(v, t) for v, t in zip(values, types)]
+
+
+def _decode_column(values: Sequence, sqltype: TypeEngine) -> np.ndarray:
+    if isinstance(sqltype, DateTime):
+        return _to_utc_datetimes(values).asi8
+    if isinstance(sqltype, Integer):
+        try:
+            return np.asarray(values, dtype=np.int64)
+        except TypeError:
+            # NULLs are there, follow `coerce_float=True` of `from_records()`
+            return np.asarray(values, dtype=float)
+    if isinstance(sqltype, (Float, Numeric)):
+        return np.asarray(values, dtype=float)
+    if isinstance(sqltype, Boolean):
+        arr = np.array(values.tolist() if isinstance(values, np.ndarray) else values)
+        if arr.dtype != bool:
+            arr = arr.astype(object)
+        return arr
+    if isinstance(sqltype, ARRAY):
+        return pd.Series(values, dtype=object).values
+    return np.asarray(values, dtype=object)
+
+
+def _assemble_frame(chunks: List[List[np.ndarray]],
+                    names: List[str],
+                    types: List[TypeEngine],
+                    ) -> pd.DataFrame:
+    """Join the decoded chunks and build the DataFrame."""
+    data = {}
+    for name, column, sqltype in zip(names, chunks, types):
+        if len(column) == 1:
+            arr = column[0]
+        elif column:
+            arr = np.concatenate(column)
+        else:
+            arr = _decode_column((), sqltype)
+        if isinstance(sqltype, DateTime):
+            arr = arr.view("datetime64[ns]")
+        data[name] = arr
+    frame = pd.DataFrame(data, columns=names)
+    # pandas converts tz-aware columns to objects and back in the constructor, avoid that
+    for name, sqltype in zip(names, types):
+        if isinstance(sqltype, DateTime):
+            frame[name] = pd.DatetimeIndex(frame[name].values, tz=timezone.utc)
+    return frame
@@ -320,6 +320,8 @@ class Auth0:
         deserialize=pickle.loads,
         key=lambda token, **_: (token,),
         cache=lambda self, **_: self._cache,
+        l1_size=1024,
+        l1_ttl=60,
     )
     async def _get_user_info_cached(self, token: str) -> User:
         resp = await self._session.get("https://%s/userinfo" % self._domain,
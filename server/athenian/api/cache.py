@@ -1,8 +1,15 @@
+import asyncio
+from collections import OrderedDict
 import functools
 import inspect
+import logging
+import os
 import pickle
+import struct
 import time
-from typing import Any, ByteString, Callable, Coroutine, Optional, Tuple, Union
+from typing import Any, ByteString, Callable, Coroutine, Dict, List, Optional, Sequence, Set, \
+    Tuple, Union
+from weakref import WeakKeyDictionary
 
 import aiomcache
 from prometheus_client import CollectorRegistry, Counter, Histogram
@@ -10,21 +17,263 @@ from xxhash import xxh64_hexdigest
 
 
 pickle.dumps = functools.partial(pickle.dumps, protocol=-1)
+# memcached refuses to store items bigger than 1 MiB by default, including the key and the headers
+MAX_ITEM_SIZE = int(os.getenv("ATHENIAN_CACHE_MAX_ITEM_SIZE", str(1000 * 1000)))
+# how often we check whether the owner of the lease has stored the value, in seconds
+LEASE_POLL_INTERVAL = 0.1
+# how long we trust the in-process copies of the namespace versions, in seconds;
+# the other processes notice bump_cache_namespace() with this delay at most
+NAMESPACE_VERSION_TTL = 5
+# how many namespace versions we keep in memory in front of each memcached client
+NAMESPACE_VERSION_L1_SIZE = 10000
+# the oversized values are replaced with a manifest which starts with this
+_CHUNKS_MAGIC = b"\x00athenian.api.cache.chunks\x00"
+# generation, number of chunks, total size
+_CHUNKS_MANIFEST = struct.Struct("!8sII")
+# the values which can be stale are prefixed with the timestamp when they become stale
+_SOFT_DEADLINE = struct.Struct("!d")
 
 
-def _gen_cache_key(fmt: str, *args) -> bytes:
+def gen_cache_key(fmt: str, *args) -> bytes:
     """Compose a memcached-friendly cache key from a printf-like."""
-    full_key = (fmt % args).encode()
+    return _hash_cache_key((fmt % args).encode())
+
+
+def _hash_cache_key(full_key: bytes) -> bytes:
+    """Compose a memcached-friendly cache key from an arbitrarily long one."""
     first_half = xxh64_hexdigest(full_key[:len(full_key) // 2])
     second_half = xxh64_hexdigest(full_key[len(full_key) // 2:])
     return (first_half + second_half).encode()
 
 
+def _gen_binder(func: Callable) -> Callable[[tuple, dict], Dict[str, Any]]:
+    """
+    Return the function which maps the call arguments of `func` to the parameter names.
+
+    The result equals to `inspect.signature(func).bind(*args, **kwargs).arguments`. We inspect \
+    `func` only once and avoid `bind()` if all the parameters are positional-or-keyword.
+    """
+    signature = inspect.signature(func)
+    bind = signature.bind
+    params = signature.parameters.values()
+    if any(p.kind != inspect.Parameter.POSITIONAL_OR_KEYWORD for p in params):
+        return lambda args, kwargs: bind(*args, **kwargs).arguments
+    names = tuple(p.name for p in params)
+    known = frozenset(names)
+    # positional-or-keyword parameters with defaults always follow those without
+    required = sum(1 for p in params if p.default is inspect.Parameter.empty)
+
+    def bind_fast(args: tuple, kwargs: dict) -> Dict[str, Any]:
+        if len(args) > len(names):
+            return bind(*args, **kwargs).arguments
+        args_dict = dict(zip(names, args))
+        if kwargs:
+            if not known.issuperset(kwargs) or not args_dict.keys().isdisjoint(kwargs):
+                return bind(*args, **kwargs).arguments
+            args_dict.update(kwargs)
+        if len(args) < required and any(n not in args_dict for n in names[len(args):required]):
+            # let bind() raise the proper TypeError
+            return bind(*args, **kwargs).arguments
+        return args_dict
+
+    return bind_fast
+
+
+def _gen_cache_discoverer(cache: Optional[Callable[..., Optional[aiomcache.Client]]],
+                          func: Callable,
+                          decorator: str,
+                          ) -> Callable[..., Optional[aiomcache.Client]]:
+    """Return the function which extracts the cache client from the bound call arguments."""
+    if cache is None:
+        def discover_cache(**kwargs) -> Optional[aiomcache.Client]:
+            try:
+                return kwargs["cache"]
+            except KeyError:
+                raise AssertionError(
+                    '"cache" is not one of %s arguments, you must explicitly define it: '
+                    '@%s(cache=...)' % (func.__qualname__, decorator))  # noqa: Q000
+        return discover_cache
+    if callable(cache):
+        return cache
+
+    def discover_cache(**kwargs):
+        return cache
+
+    return discover_cache
+
+
+def _gen_chunk_key(key: bytes, generation: bytes, index: int) -> bytes:
+    return gen_cache_key("%s|%s|%d", key.decode(), generation.hex(), index)
+
+
+async def set_chunked(client: aiomcache.Client, key: bytes, value: ByteString, exptime: int,
+                      full_name: str) -> None:
+    """
+    Store the value in memcached, splitting it into several items if it is too big.
+
+    We write the chunks under the keys which contain a random generation tag, and then the \
+    manifest under the original key. Thus the concurrent readers either see the complete \
+    previous generation or the complete new one.
+
+    :param full_name: Name of the cached function in the metrics.
+    """
+    if len(value) <= MAX_ITEM_SIZE:
+        await client.set(key, value, exptime=exptime)
+        return
+    client.metrics["oversized"].labels(__package__, full_name).inc()
+    value = memoryview(value)
+    generation = os.urandom(8)
+    chunks = [value[i:i + MAX_ITEM_SIZE] for i in range(0, len(value), MAX_ITEM_SIZE)]
+    await asyncio.gather(*(
+        client.set(_gen_chunk_key(key, generation, i), chunk, exptime=exptime)
+        for i, chunk in enumerate(chunks)))
+    manifest = _CHUNKS_MAGIC + _CHUNKS_MANIFEST.pack(generation, len(chunks), len(value))
+    await client.set(key, manifest, exptime=exptime)
+
+
+async def get_chunked(client: aiomcache.Client, key: bytes) -> Optional[ByteString]:
+    """Load the value stored by `set_chunked()`. Return None if any chunk is missing."""
+    buffer = await client.get(key)
+    if buffer is None or buffer[:len(_CHUNKS_MAGIC)] != _CHUNKS_MAGIC:
+        return buffer
+    generation, count, size = _CHUNKS_MANIFEST.unpack(buffer[len(_CHUNKS_MAGIC):])
+    chunks = await client.multi_get(*(_gen_chunk_key(key, generation, i) for i in range(count)))
+    if any(chunk is None for chunk in chunks):
+        return None
+    buffer = b"".join(chunks)
+    if len(buffer) != size:
+        return None
+    return buffer
+
+
+async def _acquire_lease(client: aiomcache.Client, key: bytes, lease: int,
+                         ) -> Tuple[bool, Optional[ByteString]]:
+    """
+    Try to become the only process which computes the value of `key` during `lease` seconds.
+
+    If somebody else owns the lease, poll for the value until the lease is released or expires.
+
+    :return: Whether we own the lease and the value if the owner has stored it.
+    """
+    lease_key = _gen_lease_key(key)
+    if await client.add(lease_key, b"1", exptime=lease):
+        return True, None
+    deadline = time.time() + lease
+    while time.time() < deadline:
+        await asyncio.sleep(LEASE_POLL_INTERVAL)
+        buffer = await get_chunked(client, key)
+        if buffer is not None:
+            return False, buffer
+        if await client.add(lease_key, b"1", exptime=lease):
+            # the owner has failed or has just stored the value and released the lease
+            buffer = await get_chunked(client, key)
+            if buffer is not None:
+                await client.delete(lease_key)
+                return False, buffer
+            return True, None
+    return False, None
+
+
+def _gen_lease_key(key: bytes) -> bytes:
+    return key + b".lease"
+
+
+def _gen_namespace_key(namespace: str) -> bytes:
+    return gen_cache_key("athenian.api.cache.namespace|%s", namespace)
+
+
+def _discover_namespace_l1(client: aiomcache.Client) -> "_MemoryCache":
+    """Return the in-memory cache of the namespace versions in front of `client`."""
+    try:
+        return _namespace_l1s[client]
+    except KeyError:
+        l1 = _namespace_l1s[client] = _MemoryCache(
+            NAMESPACE_VERSION_L1_SIZE, NAMESPACE_VERSION_TTL)
+        return l1
+
+
+async def _get_namespace_versions(client: aiomcache.Client, namespaces: Sequence[str],
+                                  ) -> List[bytes]:
+    """
+    Load the current versions of the namespaces and initialize those which do not exist.
+
+    We keep the versions in memory for `NAMESPACE_VERSION_TTL` seconds, so that the L1 hits \
+    of `cached()` do not wait for memcached.
+    """
+    l1 = _discover_namespace_l1(client)
+    versions = {key: l1.get(key) for key in map(_gen_namespace_key, namespaces)}
+    missing = [key for key, version in versions.items() if version is None]
+    if missing:
+        for key, version in zip(missing, await client.multi_get(*missing)):
+            if version is None:
+                version = os.urandom(8)
+                if not await client.add(key, version):
+                    # somebody has initialized it concurrently
+                    version = await client.get(key) or version
+            versions[key] = version
+            l1.set(key, version)
+    return [versions[_gen_namespace_key(ns)] for ns in namespaces]
+
+
+async def bump_cache_namespace(client: Optional[aiomcache.Client], namespace: str) -> None:
+    """
+    Invalidate all the cached values in the namespace.
+
+    We replace the version of the namespace, which is part of the cache keys. Thus the old values \
+    become unreachable and expire by themselves. Call this after writing to the DB.
+    """
+    if client is None:
+        return
+    key = _gen_namespace_key(namespace)
+    version = os.urandom(8)
+    await client.set(key, version, exptime=0)
+    # this process must notice the bump immediately
+    _discover_namespace_l1(client).set(key, version)
+
+
+class _MemoryCache:
+    """Bounded in-process LRU cache of the serialized values with the uniform expiration time."""
+
+    def __init__(self, size: int, ttl: float):
+        """Initialize a new instance of `_MemoryCache`."""
+        self._size = size
+        self._ttl = ttl
+        self._items = OrderedDict()  # type: OrderedDict[bytes, Tuple[ByteString, float]]
+
+    def get(self, key: bytes) -> Optional[ByteString]:
+        """Return the cached value if it exists and has not expired yet."""
+        try:
+            value, deadline = self._items[key]
+        except KeyError:
+            return None
+        if deadline < time.time():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: bytes, value: ByteString) -> None:
+        """Put the value to the cache and evict the least recently used if there is no room."""
+        self._items[key] = value, time.time() + self._ttl
+        self._items.move_to_end(key)
+        if len(self._items) > self._size:
+            self._items.popitem(last=False)
+
+
+# the in-memory caches of the namespace versions in front of each memcached client
+_namespace_l1s = WeakKeyDictionary()  # type: WeakKeyDictionary[aiomcache.Client, _MemoryCache]
+
+
 def cached(exptime: Union[int, Callable[..., int]],
            serialize: Callable[[Any], ByteString],
            deserialize: Callable[[ByteString], Any],
            key: Callable[..., Tuple],
            cache: Optional[Callable[..., Optional[aiomcache.Client]]] = None,
+           lease: int = 0,
+           soft_exptime: int = 0,
+           l1_size: int = 0,
+           l1_ttl: float = 0,
+           namespace: Optional[Callable[..., str]] = None,
            ) -> Callable[[Callable[..., Coroutine]], Callable[..., Coroutine]]:
     """
     Return factory that creates decorators that cache function call results if possible.
@@ -37,50 +286,180 @@ def cached(exptime: Union[int, Callable[..., int]],
     :param key: Cache key selector. The decorated function's arguments are converted to **kwargs.
     :param cache: Cache client extractor. The decorated function's arguments are converted to \
                   **kwargs. If is None, the client is assigned to the function's "cache" argument.
+    :param lease: If positive, only one process computes the missing value during this number \
+                  of seconds. It holds a memcached lock with this expiration time, while the \
+                  others poll for the value and compute it themselves after the lock expires.
+    :param soft_exptime: If positive, the cached values become stale after this number of \
+                         seconds. We return the stale values immediately and recompute them in \
+                         the background. `exptime` remains the hard upper bound.
+    :param l1_size: If positive, keep up to this number of the most recently used values \
+                    in memory in front of each memcached client.
+    :param l1_ttl: Time in seconds to keep the values in memory.
+    :param namespace: Cache namespace selector. The decorated function's arguments are converted \
+                      to **kwargs. `bump_cache_namespace()` invalidates all the values in the \
+                      namespace at once.
     :return: Decorator that cache function call results if possible.
     """
     def wrapper_cached(func: Callable[..., Coroutine]) -> Callable[..., Coroutine]:
         """Decorate a function to return the cached result if possible."""
-        if cache is None:
-            def discover_cache(**kwargs) -> Optional[aiomcache.Client]:
-                try:
-                    return kwargs["cache"]
-                except KeyError:
-                    raise AssertionError(
-                        '"cache" is not one of %s arguments, you must explicitly define it: '
-                        '@cached(cache=...)' % func.__qualname__)  # noqa: Q000
-        elif callable(cache):
-            discover_cache = cache
-        else:
-            def discover_cache(**kwargs):
-                return cache
+        discover_cache = _gen_cache_discoverer(cache, func, "cached")
+        # the futures of the computations which are currently in progress, by cache key
+        in_flight = {}  # type: Dict[bytes, asyncio.Future]
+        # we must reference the background refreshes until they finish
+        refreshes = set()  # type: Set[asyncio.Future]
+        # the in-memory caches in front of each memcached client
+        l1s = WeakKeyDictionary()  # type: WeakKeyDictionary[aiomcache.Client, _MemoryCache]
+        full_name = func.__module__ + "." + func.__qualname__
+        key_prefix = (full_name + "|").encode()
+        bind = _gen_binder(func)
+
+        def unwrap(buffer: ByteString) -> Tuple[ByteString, bool]:
+            """Cut the soft deadline from the cached value and check whether it is stale."""
+            if soft_exptime <= 0:
+                return buffer, False
+            deadline, = _SOFT_DEADLINE.unpack(buffer[:_SOFT_DEADLINE.size])
+            return buffer[_SOFT_DEADLINE.size:], deadline < time.time()
+
+        def discover_l1(client: aiomcache.Client) -> Optional[_MemoryCache]:
+            """Return the in-memory cache in front of `client` if it is enabled."""
+            if l1_size <= 0:
+                return None
+            try:
+                return l1s[client]
+            except KeyError:
+                l1 = l1s[client] = _MemoryCache(l1_size, l1_ttl)
+                return l1
+
+        def take_off(cache_key: bytes) -> asyncio.Future:
+            """Register the computation of `cache_key` so that the others wait for it."""
+            flight = in_flight[cache_key] = asyncio.get_event_loop().create_future()
+            return flight
+
+        async def compute(flight: asyncio.Future, args: tuple, kwargs: dict,
+                          args_dict: Dict[str, Any], client: aiomcache.Client, cache_key: bytes,
+                          start_time: float) -> Any:
+            """Call the function, store the result in the cache and resolve `flight`."""
+            owner = False
+            try:
+                if lease > 0:
+                    owner, buffer = await _acquire_lease(client, cache_key, lease)
+                    if buffer is not None:
+                        buffer, _ = unwrap(buffer)
+                        flight.set_result(buffer)
+                        client.metrics["hits"].labels(__package__, full_name).inc()
+                        client.metrics["hit_latency"].labels(__package__, full_name).observe(
+                            time.time() - start_time)
+                        return deserialize(buffer)
+                result = await func(*args, **kwargs)
+                t = exptime(result=result, **args_dict) if callable(exptime) else exptime
+                serialize_start_time = time.time()
+                payload = serialize(result)
+                client.metrics["serialization_time"].labels(__package__, full_name).observe(
+                    time.time() - serialize_start_time)
+                client.metrics["payload_size"].labels(__package__, full_name).observe(
+                    len(payload))
+                flight.set_result(payload)
+                if soft_exptime > 0:
+                    payload = _SOFT_DEADLINE.pack(time.time() + soft_exptime) + payload
+                l1 = discover_l1(client)
+                if l1 is not None:
+                    l1.set(cache_key, payload)
+                await set_chunked(client, cache_key, payload, t, full_name)
+            except asyncio.CancelledError:
+                if not flight.done():
+                    flight.cancel()
+                raise
+            except Exception as e:
+                if not flight.done():
+                    flight.set_exception(e)
+                    # do not complain if nobody waits for the result
+                    flight.exception()
+                raise
+            finally:
+                if in_flight.get(cache_key) is flight:
+                    del in_flight[cache_key]
+                if owner:
+                    # the value is stored, or let the others compute right away if we failed
+                    await client.delete(_gen_lease_key(cache_key))
+            client.metrics["misses"].labels(__package__, full_name).inc()
+            client.metrics["miss_latency"].labels(__package__, full_name).observe(
+                time.time() - start_time)
+            return result
+
+        async def refresh(*args) -> None:
+            """Recompute the stale value in the background."""
+            try:
+                await compute(*args)
+            except Exception:
+                logging.getLogger(__package__).exception("Failed to refresh %s", full_name)
+
+        def land(flight: asyncio.Future, cache_key: bytes, task: asyncio.Future) -> None:
+            """Clean up after the background refresh, even if it has never started."""
+            refreshes.discard(task)
+            if not flight.done():
+                flight.cancel()
+            if in_flight.get(cache_key) is flight:
+                del in_flight[cache_key]
 
         # no functool.wraps() shit here! It discards the coroutine status and aiohttp notices that
         async def wrapped_cached(*args, **kwargs):
             start_time = time.time()
-            args_dict = inspect.signature(func).bind(*args, **kwargs).arguments
+            args_dict = bind(args, kwargs)
             client = discover_cache(**args_dict)
-            cache_key = full_name = None
-            if client is not None:
-                props = key(**args_dict)
-                assert isinstance(props, tuple), "key() must return a tuple"
-                full_name = func.__module__ + "." + func.__qualname__
-                cache_key = _gen_cache_key(full_name + "|" + "|".join([str(p) for p in props]))
-                buffer = await client.get(cache_key)
+            if client is None:
+                return await func(*args, **kwargs)
+            props = key(**args_dict)
+            assert isinstance(props, tuple), "key() must return a tuple"
+            full_key = key_prefix + "|".join([str(p) for p in props]).encode()
+            if namespace is not None:
+                version, = await _get_namespace_versions(client, [namespace(**args_dict)])
+                full_key += b"|" + version.hex().encode()
+            cache_key = _hash_cache_key(full_key)
+            buffer = None
+            l1 = discover_l1(client)
+            if l1 is not None:
+                buffer = l1.get(cache_key)
+                client.metrics["l1_hits" if buffer is not None else "l1_misses"].labels(
+                    __package__, full_name).inc()
+            if buffer is None:
+                buffer = await get_chunked(client, cache_key)
                 if buffer is not None:
-                    result = deserialize(buffer)
                     client.metrics["hits"].labels(__package__, full_name).inc()
-                    client.metrics["hit_latency"].labels(__package__, full_name).observe(
-                        time.time() - start_time)
-                    return result
-            result = await func(*args, **kwargs)
-            if client is not None:
-                t = exptime(result=result, **args_dict) if callable(exptime) else exptime
-                await client.set(cache_key, serialize(result), exptime=t)
-                client.metrics["misses"].labels(__package__, full_name).inc()
-                client.metrics["miss_latency"].labels(__package__, full_name).observe(
+                    if l1 is not None:
+                        l1.set(cache_key, buffer)
+            if buffer is not None:
+                buffer, stale = unwrap(buffer)
+                deserialize_start_time = time.time()
+                result = deserialize(buffer)
+                client.metrics["deserialization_time"].labels(__package__, full_name).observe(
+                    time.time() - deserialize_start_time)
+                client.metrics["hit_latency"].labels(__package__, full_name).observe(
                     time.time() - start_time)
-            return result
+                if stale:
+                    client.metrics["stale"].labels(__package__, full_name).inc()
+                    if cache_key not in in_flight:
+                        flight = take_off(cache_key)
+                        task = asyncio.ensure_future(refresh(
+                            flight, args, kwargs, args_dict, client, cache_key, time.time()))
+                        refreshes.add(task)
+                        task.add_done_callback(functools.partial(land, flight, cache_key))
+                return result
+            try:
+                flight = in_flight[cache_key]
+            except KeyError:
+                return await compute(take_off(cache_key), args, kwargs, args_dict, client,
+                                     cache_key, start_time)
+            # the same call is already being computed, wait for it instead of repeating
+            client.metrics["coalesced"].labels(__package__, full_name).inc()
+            try:
+                payload = await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # the call which we waited for was cancelled, try again
+                return await wrapped_cached(*args, **kwargs)
+            # deserialize to never share the mutable results between the callers
+            return deserialize(payload)
 
         wrapped_cached.__name__ = func.__name__
         wrapped_cached.__qualname__ = func.__qualname__
@@ -93,6 +472,117 @@ def cached(exptime: Union[int, Callable[..., int]],
     return wrapper_cached
 
 
+def cached_batch(exptime: int,
+                 serialize: Callable[[Any], ByteString],
+                 deserialize: Callable[[ByteString], Any],
+                 key: Callable[..., Tuple],
+                 batch: str,
+                 cache: Optional[Callable[..., Optional[aiomcache.Client]]] = None,
+                 namespace: Optional[Callable[..., str]] = None,
+                 ) -> Callable[[Callable[..., Coroutine]], Callable[..., Coroutine]]:
+    """
+    Return factory that creates decorators that cache the results of batched calls item by item.
+
+    The decorated function accepts a sequence of items in the `batch` argument and returns the \
+    list of the results in the same order. We load the cached results of all the items with one \
+    memcached `multi_get` and call the function only once with the items which are missing.
+
+    :param exptime: Cache item expiration time delta in seconds.
+    :param serialize: Serializer of the result of one item.
+    :param deserialize: Cached binary deserializer to the result type of one item.
+    :param key: Cache key selector. Receives the item as the first argument, the other \
+                arguments of the decorated function are converted to **kwargs.
+    :param batch: Name of the decorated function's argument with the items.
+    :param cache: Cache client extractor. The decorated function's arguments are converted to \
+                  **kwargs. If is None, the client is assigned to the function's "cache" argument.
+    :param namespace: Cache namespace selector of each item, accepts the same arguments as `key`. \
+                      `bump_cache_namespace()` invalidates all the values in the namespace.
+    :return: Decorator that cache function call results if possible.
+    """
+    def wrapper_cached_batch(func: Callable[..., Coroutine]) -> Callable[..., Coroutine]:
+        """Decorate a function to return the cached results if possible."""
+        assert batch in inspect.signature(func).parameters, \
+            "%s does not have argument %s" % (func.__qualname__, batch)
+        discover_cache = _gen_cache_discoverer(cache, func, "cached_batch")
+        full_name = func.__module__ + "." + func.__qualname__
+        key_prefix = (full_name + "|").encode()
+        bind = _gen_binder(func)
+
+        async def wrapped_cached_batch(*args, **kwargs):
+            start_time = time.time()
+            args_dict = bind(args, kwargs)
+            client = discover_cache(**args_dict)
+            if client is None:
+                return await func(*args, **kwargs)
+            items = args_dict[batch]
+            if not items:
+                return []
+            kwargs = {k: v for k, v in args_dict.items() if k != batch}
+            full_keys = []
+            for item in items:
+                props = key(item, **kwargs)
+                assert isinstance(props, tuple), "key() must return a tuple"
+                full_keys.append(key_prefix + "|".join([str(p) for p in props]).encode())
+            if namespace is not None:
+                versions = await _get_namespace_versions(
+                    client, [namespace(item, **kwargs) for item in items])
+                full_keys = [k + b"|" + v.hex().encode() for k, v in zip(full_keys, versions)]
+            cache_keys = [_hash_cache_key(k) for k in full_keys]
+            unique_keys = list(dict.fromkeys(cache_keys))
+            buffers = dict(zip(unique_keys, await client.multi_get(*unique_keys)))
+            for cache_key, buffer in buffers.items():
+                if buffer is not None and buffer[:len(_CHUNKS_MAGIC)] == _CHUNKS_MAGIC:
+                    buffers[cache_key] = await get_chunked(client, cache_key)
+            missing = {}
+            for cache_key, item in zip(cache_keys, items):
+                if buffers[cache_key] is None:
+                    missing.setdefault(cache_key, item)
+            results = {}
+            if missing:
+                args_dict[batch] = list(missing.values())
+                computed = await func(**args_dict)
+                assert len(computed) == len(missing), \
+                    "%s must return one result per item" % full_name
+                serialize_start_time = time.time()
+                payloads = [serialize(r) for r in computed]
+                client.metrics["serialization_time"].labels(__package__, full_name).observe(
+                    time.time() - serialize_start_time)
+                for payload in payloads:
+                    client.metrics["payload_size"].labels(__package__, full_name).observe(
+                        len(payload))
+                await asyncio.gather(*(
+                    set_chunked(client, cache_key, payload, exptime, full_name)
+                    for cache_key, payload in zip(missing, payloads)))
+                results.update(zip(missing, computed))
+            deserialize_start_time = time.time()
+            for cache_key, buffer in buffers.items():
+                if buffer is not None:
+                    results[cache_key] = deserialize(buffer)
+            hits = len(buffers) - len(missing)
+            if hits:
+                client.metrics["deserialization_time"].labels(__package__, full_name).observe(
+                    time.time() - deserialize_start_time)
+                client.metrics["hits"].labels(__package__, full_name).inc(hits)
+            if missing:
+                client.metrics["misses"].labels(__package__, full_name).inc(len(missing))
+                client.metrics["miss_latency"].labels(__package__, full_name).observe(
+                    time.time() - start_time)
+            else:
+                client.metrics["hit_latency"].labels(__package__, full_name).observe(
+                    time.time() - start_time)
+            return [results[cache_key] for cache_key in cache_keys]
+
+        wrapped_cached_batch.__name__ = func.__name__
+        wrapped_cached_batch.__qualname__ = func.__qualname__
+        wrapped_cached_batch.__module__ = func.__module__
+        wrapped_cached_batch.__doc__ = func.__doc__
+        wrapped_cached_batch.__annotations__ = func.__annotations__
+        wrapped_cached_batch.__wrapped__ = func
+        return wrapped_cached_batch
+
+    return wrapper_cached_batch
+
+
 def setup_cache_metrics(cache: Optional[aiomcache.Client], registry: CollectorRegistry):
     """Initialize the Prometheus metrics for tracking the cache interoperability."""
     if cache is None:
@@ -118,4 +608,45 @@ def setup_cache_metrics(cache: Optional[aiomcache.Client], registry: CollectorRe
             ["app_name", "func"],
             registry=registry,
         ),
+        "oversized": Counter(
+            "cache_oversized", "Number of times the cached value was split into several items",
+            ["app_name", "func"],
+            registry=registry,
+        ),
+        "coalesced": Counter(
+            "cache_coalesced", "Number of times the call waited for the same call in progress",
+            ["app_name", "func"],
+            registry=registry,
+        ),
+        "stale": Counter(
+            "cache_stale", "Number of times the stale value was returned and refreshed",
+            ["app_name", "func"],
+            registry=registry,
+        ),
+        "l1_hits": Counter(
+            "cache_l1_hits", "Number of times the in-memory cache was useful",
+            ["app_name", "func"],
+            registry=registry,
+        ),
+        "l1_misses": Counter(
+            "cache_l1_misses", "Number of times the in-memory cache was useless",
+            ["app_name", "func"],
+            registry=registry,
+        ),
+        "payload_size": Histogram(
+            "cache_payload_size", "Size of the serialized cache items in bytes",
+            ["app_name", "func"],
+            registry=registry,
+            buckets=[1 << n for n in range(10, 27, 2)],
+        ),
+        "serialization_time": Histogram(
+            "cache_serialization_time", "Elapsed time to serialize the cache items",
+            ["app_name", "func"],
+            registry=registry,
+        ),
+        "deserialization_time": Histogram(
+            "cache_deserialization_time", "Elapsed time to deserialize the cache items",
+            ["app_name", "func"],
+            registry=registry,
+        ),
     }
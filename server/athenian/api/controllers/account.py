@@ -1,11 +1,11 @@
 import struct
-from typing import Optional, Union
+from typing import List, Optional, Sequence, Union
 
 import aiomcache
 import databases.core
 from sqlalchemy import and_, select
 
-from athenian.api.cache import cached
+from athenian.api.cache import cached, cached_batch
 from athenian.api.models.state.models import Account, UserAccount
 from athenian.api.models.web import NoSourceDataError, NotFoundError
 from athenian.api.response import ResponseError
@@ -17,6 +17,8 @@ from athenian.api.response import ResponseError
     serialize=lambda iid: struct.pack("!q", iid),
     deserialize=lambda buf: struct.unpack("!q", buf)[0],
     key=lambda account, **_: (account,),
+    l1_size=1024,
+    l1_ttl=3600,
 )
 async def get_installation_id(account: int,
                               sdb_conn: Union[databases.Database, databases.core.Connection],
@@ -31,11 +33,24 @@ async def get_installation_id(account: int,
     return iid
 
 
+def gen_account_cache_namespace(account: int) -> str:
+    """Return the cache namespace of the values which the writes to the account invalidate."""
+    return "account|%d" % account
+
+
+# The API writes to the account bump the namespace. The short TTL covers the writes which do not,
+# e.g., by the invite_admin and create_default_user scripts.
+ACCOUNT_STATUS_CACHE_TTL = 60
+
+
 @cached(
-    exptime=60,
+    exptime=ACCOUNT_STATUS_CACHE_TTL,
     serialize=lambda is_admin: b"1" if is_admin else b"0",
     deserialize=lambda buf: buf == b"1",
     key=lambda user, account, **_: (user, account),
+    l1_size=1024,
+    l1_ttl=10,
+    namespace=lambda account, **_: gen_account_cache_namespace(account),
 )
 async def get_user_account_status(user: str,
                                   account: int,
@@ -50,3 +65,28 @@ async def get_user_account_status(user: str,
         raise ResponseError(NotFoundError(
             detail="Account %d does not exist or user %s is not a member." % (account, user)))
     return status
+
+
+@cached_batch(
+    exptime=ACCOUNT_STATUS_CACHE_TTL,
+    serialize=lambda is_admin: b"1" if is_admin else b"0",
+    deserialize=lambda buf: buf == b"1",
+    key=lambda account, user, **_: (user, account),
+    batch="accounts",
+    namespace=lambda account, **_: gen_account_cache_namespace(account),
+)
+async def get_user_account_statuses(user: str,
+                                    accounts: Sequence[int],
+                                    sdb_conn: Union[databases.Database, databases.core.Connection],
+                                    cache: Optional[aiomcache.Client],
+                                    ) -> List[bool]:
+    """Return the values indicating whether the given user is an admin of each given account."""
+    rows = await sdb_conn.fetch_all(
+        select([UserAccount.account_id, UserAccount.is_admin])
+        .where(and_(UserAccount.user_id == user, UserAccount.account_id.in_(accounts))))
+    statuses = {r[UserAccount.account_id.key]: r[UserAccount.is_admin.key] for r in rows}
+    for account in accounts:
+        if account not in statuses:
+            raise ResponseError(NotFoundError(
+                detail="Account %d does not exist or user %s is not a member." % (account, user)))
+    return [statuses[account] for account in accounts]
@@ -0,0 +1,97 @@
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Collection, Optional, Union
+
+from aiohttp import web
+import aiomcache
+import databases
+from sqlalchemy import func, select
+
+from athenian.api import metadata
+from athenian.api.cache import gen_cache_key, get_chunked, set_chunked
+from athenian.api.models.metadata.github import PullRequest
+from athenian.api.request import AthenianWebRequest
+
+
+# how long we keep the serialized responses in memcached, the ETag changes with the data anyway
+RESPONSE_CACHE_TTL = 24 * 3600
+
+
+async def fetch_freshness(repos: Collection[str],
+                          mdb: Union[databases.Database, databases.core.Connection],
+                          ) -> str:
+    """
+    Return the marker which changes whenever the metadata of the repositories changes.
+
+    GitHub updates the PR's `updated_at` on every related event: commits, reviews, comments, \
+    merges, etc. The number of PRs catches the deletions.
+    """
+    row = await mdb.fetch_one(
+        select([func.max(PullRequest.updated_at), func.count(PullRequest.id)])
+        .where(PullRequest.repository_fullname.in_(repos)))
+    return "%s|%d" % (row[0], row[1])
+
+
+def gen_etag(endpoint: str, body: Any, resolved: Any, freshness: str) -> str:
+    """
+    Compose the strong ETag of the response.
+
+    :param endpoint: Name of the handler.
+    :param body: Request body as it was received.
+    :param resolved: What the request depends on besides the body, e.g. the resolved reposets.
+    :param freshness: Data freshness marker returned by `fetch_freshness()`.
+    """
+    canonical = json.dumps([metadata.__version__, endpoint, body, resolved, freshness],
+                           sort_keys=True, default=str)
+    return '"%s"' % hashlib.sha1(canonical.encode()).hexdigest()
+
+
+async def respond_with_etag(request: AthenianWebRequest,
+                            etag: str,
+                            name: str,
+                            respond: Callable[[Optional[aiomcache.Client]],
+                                              Awaitable[web.Response]],
+                            ) -> web.Response:
+    """
+    Return 304 if the client has the response with the same ETag, otherwise the response bytes \
+    from memcached or from `respond()`.
+
+    We keep only the successful responses in memcached.
+
+    :param name: Name of the handler in the cache metrics.
+    :param respond: Compute the response with the given cache client. We pass None: the inner \
+                    caches are not keyed by the data freshness, so they could put stale data \
+                    under the new ETag.
+    """
+    headers = {"ETag": etag}
+    if _match_etag(request.headers.get("If-None-Match"), etag):
+        return web.Response(status=304, headers=headers)
+    cache = request.cache
+    cache_key = gen_cache_key("athenian.api.etag|%s", etag)
+    if cache is not None:
+        body = await get_chunked(cache, cache_key)
+        if body is not None:
+            cache.metrics["hits"].labels(metadata.__package__, name).inc()
+            return web.Response(body=bytes(body), headers=headers,
+                                content_type="application/json", charset="utf-8")
+    response = await respond(None)
+    if response.status != 200:
+        return response
+    response.headers.update(headers)
+    if cache is not None:
+        cache.metrics["misses"].labels(metadata.__package__, name).inc()
+        await set_chunked(cache, cache_key, response.body, RESPONSE_CACHE_TTL, name)
+    return response
+
+
+def _match_etag(if_none_match: Optional[str], etag: str) -> bool:
+    """Check whether If-None-Match header matches the ETag by the weak comparison."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
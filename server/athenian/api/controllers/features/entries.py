@@ -1,6 +1,9 @@
+import asyncio
 from datetime import date
+import functools
+import os
 import pickle
-from typing import List, Mapping, Optional, Sequence, Tuple
+from typing import Awaitable, Callable, List, Mapping, Optional, Sequence, Tuple
 
 import aiomcache
 from databases import Database
@@ -17,18 +20,63 @@ from athenian.api.controllers.miners.pull_request_list_item import Participation
 from athenian.api.models.web.pull_request_participant import PullRequestParticipant
 
 
+# maximum number of "for" sets which we evaluate concurrently in one request
+PARALLEL_FOR_SETS = int(os.getenv("ATHENIAN_PARALLEL_FOR_SETS", "4"))
+
+
 async def calc_metrics_line_func(
-        metrics: Sequence[str], time_intervals: Sequence[date], repos: Sequence[str],
-        developers: Sequence[str], db: Database, cache: Optional[aiomcache.Client],
-) -> List[Tuple[Metric]]:
-    """All the metric calculators must follow this call signature."""
+        metrics: Sequence[str], time_intervals: Sequence[date],
+        for_sets: Sequence[Tuple[Sequence[str], Sequence[str]]],
+        db: Database, cache: Optional[aiomcache.Client],
+) -> List[List[Tuple[Metric]]]:
+    """
+    All the metric calculators must follow this call signature.
+
+    :param for_sets: (repositories, developers) pairs; we return the metrics for each.
+    """
     raise NotImplementedError
 
 
+async def calc_pull_request_metrics_line_github_many(
+        metrics: Sequence[str], time_intervals: Sequence[date],
+        for_sets: Sequence[Tuple[Sequence[str], Sequence[str]]],
+        db: Database, cache: Optional[aiomcache.Client],
+) -> List[List[Tuple[Metric]]]:
+    """
+    Calculate pull request metrics on GitHub data for each (repositories, developers) pair.
+
+    We evaluate the pairs concurrently. If some are not cached, we mine the union of all the \
+    pairs once and split it in memory.
+    """
+    union = None
+
+    async def mine(index: int) -> PullRequestTimesMiner:
+        nonlocal union
+        if union is None:
+            union = asyncio.ensure_future(PullRequestTimesMiner.mine_many(
+                time_intervals[0], time_intervals[-1], for_sets, db, cache))
+        # the others wait for the same union, do not cancel it
+        return (await asyncio.shield(union))[index]
+
+    semaphore = asyncio.Semaphore(PARALLEL_FOR_SETS)
+
+    async def calc(index: int) -> List[Tuple[Metric]]:
+        repos, developers = for_sets[index]
+        async with semaphore:
+            return await calc_pull_request_metrics_line_github(
+                metrics, time_intervals, repos, developers, db, cache,
+                functools.partial(mine, index))
+
+    return await asyncio.gather(*(calc(i) for i in range(len(for_sets))))
+
+
 @cached(
-    exptime=PullRequestTimesMiner.CACHE_TTL,
+    # the miners cache the mined PRs for CACHE_TTL, too, so the refreshes do not pile up
+    exptime=PullRequestTimesMiner.STALE_CACHE_TTL,
     serialize=pickle.dumps,
     deserialize=pickle.loads,
+    lease=60,
+    soft_exptime=PullRequestTimesMiner.CACHE_TTL,
     key=lambda metrics, time_intervals, repos, developers, **_: (
         ",".join(sorted(metrics)),
         ",".join(str(dt.toordinal()) for dt in time_intervals),
@@ -39,13 +87,21 @@ async def calc_metrics_line_func(
 async def calc_pull_request_metrics_line_github(
         metrics: Sequence[str], time_intervals: Sequence[date], repos: Sequence[str],
         developers: Sequence[str], db: Database, cache: Optional[aiomcache.Client],
+        mine: Optional[Callable[[], Awaitable[PullRequestTimesMiner]]] = None,
 ) -> List[Tuple[Metric]]:
-    """Calculate pull request metrics on GitHub data."""
-    miner = await PullRequestTimesMiner.mine(
-        time_intervals[0], time_intervals[-1], repos, developers, db, cache)
+    """
+    Calculate pull request metrics on GitHub data.
+
+    :param mine: Return the miner of `repos` and `developers` instead of mining them directly.
+    """
+    if mine is None:
+        miner = await PullRequestTimesMiner.mine(
+            time_intervals[0], time_intervals[-1], repos, developers, db, cache)
+    else:
+        miner = await mine()
     calcs = [pull_request_calculators[m]() for m in metrics]
     binned = BinnedPullRequestMetricCalculator(calcs, time_intervals)
-    return binned(miner)
+    return binned(miner.to_table())
 
 
 async def filter_pull_requests_func(
@@ -58,9 +114,12 @@ async def filter_pull_requests_func(
 
 
 @cached(
-    exptime=PullRequestListMiner.CACHE_TTL,
+    # the miners cache the mined PRs for CACHE_TTL, too, so the refreshes do not pile up
+    exptime=PullRequestListMiner.STALE_CACHE_TTL,
     serialize=pickle.dumps,
     deserialize=pickle.loads,
+    lease=60,
+    soft_exptime=PullRequestListMiner.CACHE_TTL,
     key=lambda time_from, time_to, repos, stages, participants, **_: (
         time_from.toordinal(),
         time_to.toordinal(),
@@ -86,7 +145,7 @@ async def filter_pull_requests_github(
 METRIC_ENTRIES = {
     "github": {
         # there will be other metrics in the future, hence **{}
-        **{k: calc_pull_request_metrics_line_github for k in pull_request_calculators},
+        **{k: calc_pull_request_metrics_line_github_many for k in pull_request_calculators},
     },
 }  # type: Mapping[str, Mapping[str, calc_metrics_line_func]]
 
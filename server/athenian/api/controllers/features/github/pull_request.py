@@ -1,30 +1,80 @@
 from datetime import date, datetime, timedelta, timezone
-from typing import Dict, Generic, Iterable, List, Optional, Sequence, Tuple, Type
+import functools
+from typing import Dict, Generic, Iterable, List, Optional, Sequence, Tuple, Type, Union
 
 import numpy as np
 import pandas as pd
 import scipy.stats
 
 from athenian.api.controllers.features.metric import Metric, T
-from athenian.api.controllers.miners.github.pull_request import PullRequestTimes
+from athenian.api.controllers.miners.github.pull_request import PullRequestTimes, \
+    PullRequestTimesTable
 
 
-def mean_confidence_interval(data: Sequence[T], may_have_negative_values: bool, confidence=0.95,
+def _as_array(data: Sequence[T]) -> Tuple[np.ndarray, bool]:
+    """Convert the samples to a numpy array. Timedelta-s become timedelta64[ns].
+
+    :return: The samples array and the flag indicating whether the samples were Python \
+             `timedelta`-s which should be returned back as such.
+    """
+    if isinstance(data, np.ndarray):
+        return data, False
+    if isinstance(data, pd.Series):
+        return data.values, False
+    if len(data) > 0 and isinstance(data[0], timedelta):
+        return pd.to_timedelta(data).values, not isinstance(data[0], pd.Timedelta)
+    return np.asarray(data), False
+
+
+def _from_ns(value: Union[int, float], pytimedelta: bool) -> timedelta:
+    """Convert nanoseconds to `pd.Timedelta` or to `datetime.timedelta`."""
+    td = pd.Timedelta(np.timedelta64(int(value)))
+    if pytimedelta:
+        return td.to_pytimedelta()
+    return td
+
+
+@functools.lru_cache(maxsize=4096)
+def _binom_interval(n: int, confidence: float) -> Tuple[int, int]:
+    """Calculate the order statistics indexes of the median's confidence interval. The result \
+    depends only on the number of samples and on the confidence, so we cache it."""
+    low_count, up_count = scipy.stats.binom.interval(confidence, n, 0.5)
+    return int(low_count), int(up_count) - 1
+
+
+@functools.lru_cache(maxsize=4096)
+def _t_quantiles(df: int, confidence: float) -> Tuple[float, float]:
+    """Calculate the standard Student's t-distribution critical values which bound the \
+    confidence interval. The result depends only on the degrees of freedom and on the \
+    confidence, so we cache it."""
+    a, b = scipy.stats.t.interval(confidence, df)
+    return float(a), float(b)
+
+
+def _t_interval(confidence: float, df: int, loc: float, scale: float) -> Tuple[float, float]:
+    """Equivalent of `scipy.stats.t.interval()` which reuses the cached critical values."""
+    if not scale > 0:
+        # scipy returns NaN-s in this case
+        return np.nan, np.nan
+    a, b = _t_quantiles(df, confidence)
+    return a * scale + loc, b * scale + loc
+
+
+def mean_confidence_interval(data: Union[np.ndarray, Sequence[T]],
+                             may_have_negative_values: bool, confidence=0.95,
                              ) -> Tuple[T, T, T]:
     """Calculate the mean value and the confidence interval."""
     assert len(data) > 0
+    data, pytimedelta = _as_array(data)
     ns = 1_000_000_000
     max_conf_max_ratio = 10
-    dtype_is_timedelta = isinstance(data[0], (pd.Timedelta, timedelta))
+    dtype_is_timedelta = data.dtype.kind == "m"
     if dtype_is_timedelta:
         # we have to convert the dtype because some ops required by scipy are missing
         # thus the precision is 1 second; otherwise there are integer overflows
-        if isinstance(data[0], pd.Timedelta):
-            arr = np.asarray([d.to_timedelta64() // ns for d in data], dtype=np.int64)
-        else:
-            arr = np.asarray(data, dtype="timedelta64[ns]").astype(np.int64) // ns
+        arr = data.view(np.int64) // ns
     else:
-        arr = np.asarray(data)
+        arr = data
     if may_have_negative_values:
         # assume a normal distribution
         m = np.mean(arr)
@@ -34,7 +84,7 @@ def mean_confidence_interval(data: Sequence[T], may_have_negative_values: bool,
             conf_max = max_conf_max_ratio * m
         else:
             sem = scipy.stats.sem(arr)
-            conf_min, conf_max = scipy.stats.t.interval(confidence, len(arr) - 1, loc=m, scale=sem)
+            conf_min, conf_max = _t_interval(confidence, len(arr) - 1, loc=m, scale=sem)
     else:
         # assume a log-normal distribution
         assert (arr >= 0).all()
@@ -51,71 +101,172 @@ def mean_confidence_interval(data: Sequence[T], may_have_negative_values: bool,
             logvar = np.var(logarr, ddof=1)
             logm = np.mean(logarr)
             d = np.sqrt(logvar / len(arr) + logvar**2 / (2 * (len(arr) - 1)))
-            conf_min, conf_max = scipy.stats.t.interval(
+            conf_min, conf_max = _t_interval(
                 confidence, len(arr) - 1, loc=logm + logvar / 2, scale=d)
             conf_min, conf_max = np.exp(conf_min), np.exp(conf_max)
             if conf_max / m > max_conf_max_ratio:
                 conf_max = max_conf_max_ratio * m
     if dtype_is_timedelta:
         # convert the dtype back
-        m = pd.Timedelta(np.timedelta64(int(m * ns)))
-        conf_min = pd.Timedelta(np.timedelta64(int(conf_min * ns)))
-        conf_max = pd.Timedelta(np.timedelta64(int(conf_max * ns)))
-        if not isinstance(data[0], pd.Timedelta):
-            m = m.to_pytimedelta()
-            conf_min = conf_min.to_pytimedelta()
-            conf_max = conf_max.to_pytimedelta()
-    else:
-        # ensure the original dtype (can have been switched to float under the hood)
-        dt = type(data[0])
-        m = dt(m)
-        conf_min = dt(conf_min)
-        conf_max = dt(conf_max)
-    return m, conf_min, conf_max
+        return tuple(_from_ns(v * ns, pytimedelta) for v in (m, conf_min, conf_max))
+    # ensure the original dtype (can have been switched to float under the hood)
+    # and return the Python scalars like the samples which the metric calculators collect
+    dt = data.dtype.type
+    return dt(m).item(), dt(conf_min).item(), dt(conf_max).item()
 
 
-def median_confidence_interval(data: Sequence[T], confidence=0.95) -> Tuple[T, T, T]:
+def median_confidence_interval(data: Union[np.ndarray, Sequence[T]], confidence=0.95,
+                               ) -> Tuple[T, T, T]:
     """Calculate the median value and the confidence interval."""
     assert len(data) > 0
-    arr = np.asarray(data)
+    data, pytimedelta = _as_array(data)
+    return median_confidence_interval_batch(
+        data, np.array([len(data)]), confidence, pytimedelta)[0]
+
+
+def median_confidence_interval_batch(data: np.ndarray, offsets: np.ndarray, confidence=0.95,
+                                     pytimedelta=False) -> List[Optional[Tuple[T, T, T]]]:
+    """
+    Calculate the median values and the confidence intervals of several sample groups at once.
+
+    :param data: Concatenated samples of all the groups.
+    :param offsets: Where each group ends in `data`, that is, the cumulative group sizes.
+    :param confidence: Confidence level of the intervals.
+    :param pytimedelta: Return `datetime.timedelta` instead of `pd.Timedelta` for timedelta64 \
+                        `data`.
+    :return: (median, confidence min, confidence max) for each group or None if it is empty.
+    """
+    dtype_is_timedelta = data.dtype.kind == "m"
+    arr = data.view(np.int64) if dtype_is_timedelta else data
+    offsets = np.asarray(offsets, dtype=int)
+    lengths = np.diff(offsets, prepend=0)
+    # sort all the groups in one go: the group index is the primary key
+    groups = np.repeat(np.arange(len(offsets)), lengths)
+    arr = arr[np.lexsort((arr, groups))]
+    nonempty = np.flatnonzero(lengths)
+    begs = offsets[nonempty] - lengths[nonempty]
+    sizes = lengths[nonempty]
     # The following code is based on:
     # https://onlinecourses.science.psu.edu/stat414/node/316
-    arr = np.sort(arr)
-    low_count, up_count = scipy.stats.binom.interval(confidence, arr.shape[0], 0.5)
-    low_count, up_count = int(low_count), int(up_count)
-    dt = type(data[0]) if type(data[0]) is not timedelta else lambda x: x
-    return dt(np.median(arr)), dt(arr[low_count]), dt(arr[up_count - 1])
+    bounds = np.array([_binom_interval(n, confidence) for n in sizes.tolist()],
+                      dtype=int).reshape(-1, 2)
+    lows = arr[begs + bounds[:, 0]]
+    ups = arr[begs + bounds[:, 1]]
+    middles = begs + sizes // 2
+    medians = arr[middles]
+    even = middles[sizes % 2 == 0]
+    lefts, rights = arr[even - 1], arr[even]
+    if arr.dtype.kind in "iu":
+        # np.median() would switch to float64 and lose the nanosecond precision;
+        # besides, a + b may overflow
+        halves = lefts + (rights - lefts) // 2
+        # round towards zero like the float division does
+        halves += ((rights - lefts) % 2 == 1) & (halves < 0)
+        medians[sizes % 2 == 0] = halves
+    else:
+        medians[sizes % 2 == 0] = (lefts + rights) / 2
+    if dtype_is_timedelta:
+        def convert(x):
+            return _from_ns(x, pytimedelta)
+    else:
+        def convert(x):
+            return data.dtype.type(x).item()
+    result = [None] * len(offsets)
+    for i, median, low, up in zip(nonempty.tolist(), medians, lows, ups):
+        result[i] = convert(median), convert(low), convert(up)
+    return result
+
+
+def to_datetime64(dt: datetime) -> np.datetime64:
+    """Convert a datetime to the UTC naive numpy scalar which is comparable with the columns \
+    of `PullRequestTimesTable.best`. Naive datetimes are assumed to be in UTC."""
+    ts = pd.Timestamp(dt)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(None)
+    return ts.to_datetime64()
+
+
+def in_interval(column: np.ndarray, min_time: datetime, max_time: datetime) -> np.ndarray:
+    """Return the mask of the timestamps strictly inside (`min_time`, `max_time`). NaT-s are \
+    always outside."""
+    return (column > to_datetime64(min_time)) & (column < to_datetime64(max_time))
 
 
 class PullRequestMetricCalculator(Generic[T]):
     """
     Pull request metric calculator, base abstract class.
 
-    Each call to `PullRequestMetricCalculator()` feeds another PR to update the state.
+    Each call to `PullRequestMetricCalculator()` feeds another PR or a whole \
+    `PullRequestTimesTable` to update the state.
     `PullRequestMetricCalculator.value()` returns the current metric value.
-    `PullRequestMetricCalculator.analyze()` is to be implemented by the particular metric
-    calculators.
+    `PullRequestMetricCalculator.analyze()` and `PullRequestMetricCalculator.analyze_batch()` \
+    are to be implemented by the particular metric calculators.
     """
 
+    initial_capacity = 64
+
     def __init__(self):
         """Initialize a new `PullRequestMetricCalculator` instance."""
-        self.samples = []
-
-    def __call__(self, times: PullRequestTimes, min_time: datetime, max_time: datetime):
+        # timedelta-s are stored as timedelta64[ns], that is, int64 nanoseconds
+        self._buffer: Optional[np.ndarray] = None
+        self._size = 0
+
+    def __getstate__(self) -> dict:
+        """Do not pickle the unused buffer capacity."""
+        state = self.__dict__.copy()
+        if self._buffer is not None:
+            state["_buffer"] = self.samples.copy()
+        return state
+
+    @property
+    def samples(self) -> np.ndarray:
+        """Return the collected samples without copying."""
+        if self._buffer is None:
+            return np.array([], dtype=np.int64)
+        return self._buffer[:self._size]
+
+    def _append(self, samples: np.ndarray) -> None:
+        """Add more samples to the buffer, growing it if necessary."""
+        if len(samples) == 0:
+            return
+        if self._buffer is None:
+            self._buffer = np.empty(max(self.initial_capacity, len(samples)), samples.dtype)
+        size = self._size + len(samples)
+        if size > len(self._buffer):
+            buffer = np.empty(max(size, 2 * len(self._buffer)), self._buffer.dtype)
+            buffer[:self._size] = self._buffer[:self._size]
+            self._buffer = buffer
+        self._buffer[self._size:size] = samples
+        self._size = size
+
+    def _unbox(self, value: np.generic) -> T:
+        """Convert a numpy scalar of the buffer's dtype to the Python object for `Metric`."""
+        if self._buffer.dtype.kind == "m":
+            return pd.Timedelta(value)
+        return value.item()
+
+    def __call__(self, times: Union[PullRequestTimes, PullRequestTimesTable],
+                 min_time: datetime, max_time: datetime):
         """Supply another pull request timestamps to update the state.
 
+        :param times: Timestamps of a single PR or of many PRs at once.
         :param min_time: Start of the considered time interval. It is needed to discard samples \
                          with both ends less than the minimum time.
         :param max_time: Finish of the considered time interval. It is needed to discard samples \
                          with both ends greater than the maximum time.
         """
+        if isinstance(times, PullRequestTimesTable):
+            self._append(self.analyze_batch(times, min_time, max_time).compressed())
+            return
         sample = self.analyze(times, min_time, max_time)
         if sample is not None:
-            self.samples.append(sample)
+            if isinstance(sample, timedelta):
+                sample = pd.Timedelta(sample).to_timedelta64()
+            self._append(np.array([sample]))
 
     def reset(self):
         """Reset the internal state."""
-        self.samples.clear()
+        self._size = 0
 
     def value(self) -> Metric[T]:
         """Calculate the current metric value."""
@@ -126,6 +277,12 @@ class PullRequestMetricCalculator(Generic[T]):
         """Calculate the actual state update."""
         raise NotImplementedError
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once. The masked elements \
+        correspond to `analyze()` returning None."""
+        raise NotImplementedError
+
 
 class PullRequestAverageMetricCalculator(PullRequestMetricCalculator[T]):
     """Mean calculator."""
@@ -134,7 +291,7 @@ class PullRequestAverageMetricCalculator(PullRequestMetricCalculator[T]):
 
     def value(self) -> Metric[T]:
         """Calculate the current metric value."""
-        if not self.samples:
+        if self._size == 0:
             return Metric(False, None, None, None)
         assert self.may_have_negative_values is not None
         return Metric(True, *mean_confidence_interval(self.samples, self.may_have_negative_values))
@@ -144,35 +301,64 @@ class PullRequestAverageMetricCalculator(PullRequestMetricCalculator[T]):
         """Calculate the actual state update."""
         raise NotImplementedError
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once. The masked elements \
+        correspond to `analyze()` returning None."""
+        raise NotImplementedError
+
 
 class PullRequestMedianMetricCalculator(PullRequestMetricCalculator[T]):
     """Median calculator."""
 
     def value(self) -> Metric[T]:
         """Calculate the current metric value."""
-        if not self.samples:
+        if self._size == 0:
             return Metric(False, None, None, None)
         return Metric(True, *median_confidence_interval(self.samples))
 
+    def values(self, offsets: np.ndarray) -> List[Metric[T]]:
+        """Calculate the metric values of several consecutive sample groups at once.
+
+        :param offsets: Where each group ends in `samples`.
+        """
+        if self._size == 0:
+            return [Metric(False, None, None, None)] * len(offsets)
+        return [Metric(True, *m) if m is not None else Metric(False, None, None, None)
+                for m in median_confidence_interval_batch(self.samples, offsets)]
+
     def analyze(self, times: PullRequestTimes, min_time: datetime, max_time: datetime,
                 ) -> Optional[T]:
         """Calculate the actual state update."""
         raise NotImplementedError
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once. The masked elements \
+        correspond to `analyze()` returning None."""
+        raise NotImplementedError
+
 
 class PullRequestSumMetricCalculator(PullRequestMetricCalculator[T]):
     """Sum calculator."""
 
     def value(self) -> Metric[T]:
         """Calculate the current metric value."""
-        exists = bool(self.samples)
-        return Metric(exists, sum(self.samples) if exists else None, None, None)
+        if self._size == 0:
+            return Metric(False, None, None, None)
+        return Metric(True, self._unbox(self.samples.sum()), None, None)
 
     def analyze(self, times: PullRequestTimes, min_time: datetime, max_time: datetime,
                 ) -> Optional[T]:
         """Calculate the actual state update."""
         raise NotImplementedError
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once. The masked elements \
+        correspond to `analyze()` returning None."""
+        raise NotImplementedError
+
 
 class PullRequestCounter(PullRequestSumMetricCalculator[int]):
     """Count the number of PRs that were used to calculate the specified metric."""
@@ -189,6 +375,12 @@ class PullRequestCounter(PullRequestSumMetricCalculator[int]):
         """Calculate the actual state update."""
         return int(self.calc.analyze(times, min_time, max_time) is not None)
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once."""
+        return np.ma.masked_array((~np.ma.getmaskarray(
+            self.calc.analyze_batch(times, min_time, max_time))).astype(int))
+
 
 calculators: Dict[str, Type[PullRequestMetricCalculator]] = {}
 
@@ -220,35 +412,50 @@ class BinnedPullRequestMetricCalculator(Generic[T]):
         self.time_intervals = [datetime.combine(d, datetime.min.time(), tzinfo=timezone.utc)
                                for d in time_intervals]
 
-    def __call__(self, items: Iterable[PullRequestTimes]) -> List[Tuple[Metric[T]]]:
+    def __call__(self, items: Union[PullRequestTimesTable, Iterable[PullRequestTimes]],
+                 ) -> List[Tuple[Metric[T]]]:
         """
         Calculate the binned metrics.
 
-        For each time interval we collect the list of PRs that are relevant and measure \
-        the specified metrics.
+        For each time interval we collect the PRs that are relevant and measure the specified \
+        metrics on all of them at once.
         """
-        borders = self.time_intervals
+        if not isinstance(items, PullRequestTimesTable):
+            items = PullRequestTimesTable.from_times(list(items))
+        borders = np.array([to_datetime64(b) for b in self.time_intervals])
         calcs = self.calcs
-        bins = [[] for _ in borders[:-1]]
-        items = sorted(items, key=lambda x: x.created.best)
-        pos = 0
-        for item in items:
-            while pos < len(borders) - 1 and item.created.best > borders[pos + 1]:
-                pos += 1
-            if item.closed:
-                span = pos
-                while span < len(bins) and item.closed.best > borders[span]:
-                    bins[span].append(item)
-                    span += 1
-            else:
-                for span in range(pos, len(bins)):
-                    bins[span].append(item)
+        created = items.best["created"].values
+        closed = items.best["closed"].values
+        # each PR belongs to the bins [first_bin, last_bin): it was created before the end of
+        # first_bin and was not closed before the start of last_bin
+        first_bins = np.searchsorted(borders[1:], created, side="left")
+        last_bins = np.searchsorted(borders[:-1], closed, side="left")
+        last_bins[np.isnat(closed)] = len(borders) - 1
+        order = np.argsort(first_bins, kind="stable")
+        first_bins = first_bins[order]
+        last_bins = last_bins[order]
+        # the medians of all the bins are calculated together at the end
+        batched = [isinstance(calc, PullRequestMedianMetricCalculator) for calc in calcs]
+        offsets = [[] for _ in calcs]
         result = []
-        for bin, time_from, time_to in zip(bins, borders, borders[1:]):
-            for item in bin:
-                for calc in calcs:
-                    calc(item, time_from, time_to)
-            result.append(tuple(calc.value() for calc in calcs))
-            for calc in calcs:
-                calc.reset()
-        return result
+        for i, (time_from, time_to) in enumerate(zip(self.time_intervals,
+                                                     self.time_intervals[1:])):
+            started = np.searchsorted(first_bins, i, side="right")
+            bin_items = items.take(order[:started][last_bins[:started] > i])
+            values = []
+            for calc, calc_batched, calc_offsets in zip(calcs, batched, offsets):
+                calc(bin_items, time_from, time_to)
+                if calc_batched:
+                    calc_offsets.append(len(calc.samples))
+                    values.append(None)
+                else:
+                    values.append(calc.value())
+                    calc.reset()
+            result.append(values)
+        for j, (calc, calc_batched, calc_offsets) in enumerate(zip(calcs, batched, offsets)):
+            if not calc_batched:
+                continue
+            for values, value in zip(result, calc.values(np.array(calc_offsets, dtype=int))):
+                values[j] = value
+            calc.reset()
+        return [tuple(values) for values in result]
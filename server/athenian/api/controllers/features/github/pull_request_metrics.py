@@ -1,11 +1,14 @@
 from datetime import datetime, timedelta
 from typing import Optional
 
-from athenian.api.controllers.features.github.pull_request import \
+import numpy as np
+
+from athenian.api.controllers.features.github.pull_request import in_interval, \
     PullRequestCounter, PullRequestMedianMetricCalculator, PullRequestMetricCalculator, \
-    PullRequestSumMetricCalculator, register
+    PullRequestSumMetricCalculator, register, to_datetime64
 from athenian.api.controllers.features.metric import Metric
-from athenian.api.controllers.miners.github.pull_request import PullRequestTimes
+from athenian.api.controllers.miners.github.pull_request import PullRequestTimes, \
+    PullRequestTimesTable
 from athenian.api.models.web import MetricID
 
 
@@ -22,6 +25,14 @@ class WorkInProgressTimeCalculator(PullRequestMedianMetricCalculator[timedelta])
             return times.first_review_request.best - times.work_began.best
         return None
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once."""
+        first_review_request = times.best["first_review_request"].values
+        return np.ma.masked_array(
+            first_review_request - times.best["work_began"].values,
+            ~in_interval(first_review_request, min_time, max_time))
+
 
 @register(MetricID.PR_WIP_COUNT)
 class WorkInProgressCounter(PullRequestCounter):
@@ -51,6 +62,18 @@ class ReviewTimeCalculator(PullRequestMedianMetricCalculator[timedelta]):
                 assert False  # noqa
         return None
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once."""
+        first_review_request = times.best["first_review_request"].values
+        approved = times.best["approved"].values
+        last_review = times.best["last_review"].values
+        mask = ~np.isnat(first_review_request) & ~np.isnat(times.best["closed"].values) & (
+            in_interval(approved, min_time, max_time)
+            | in_interval(last_review, min_time, max_time))  # noqa: W503
+        finished = np.where(np.isnat(approved), last_review, approved)
+        return np.ma.masked_array(finished - first_review_request, ~mask)
+
 
 @register(MetricID.PR_REVIEW_COUNT)
 class ReviewCounter(PullRequestCounter):
@@ -78,6 +101,19 @@ class MergingTimeCalculator(PullRequestMedianMetricCalculator[timedelta]):
                 return times.closed.best - times.last_commit.best
         return None
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once."""
+        closed = times.best["closed"].values
+        approved = times.best["approved"].values
+        last_review = times.best["last_review"].values
+        finished = np.where(
+            np.isnat(approved),
+            np.where(np.isnat(last_review), times.best["last_commit"].values, last_review),
+            approved)
+        mask = in_interval(closed, min_time, max_time) & ~np.isnat(finished)
+        return np.ma.masked_array(closed - finished, ~mask)
+
 
 @register(MetricID.PR_MERGING_COUNT)
 class MergingCounter(PullRequestCounter):
@@ -99,6 +135,14 @@ class ReleaseTimeCalculator(PullRequestMedianMetricCalculator[timedelta]):
             return times.released.best - times.merged.best
         return None
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once."""
+        released = times.best["released"].values
+        merged = times.best["merged"].values
+        mask = ~np.isnat(merged) & in_interval(released, min_time, max_time)
+        return np.ma.masked_array(released - merged, ~mask)
+
 
 @register(MetricID.PR_RELEASE_COUNT)
 class ReleaseCounter(PullRequestCounter):
@@ -120,6 +164,13 @@ class LeadTimeCalculator(PullRequestMedianMetricCalculator[timedelta]):
             return times.released.best - times.work_began.best
         return None
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once."""
+        released = times.best["released"].values
+        return np.ma.masked_array(released - times.best["work_began"].values,
+                                  ~in_interval(released, min_time, max_time))
+
 
 @register(MetricID.PR_LEAD_COUNT)
 class LeadCounter(PullRequestCounter):
@@ -142,6 +193,14 @@ class WaitFirstReviewTimeCalculator(PullRequestMedianMetricCalculator[timedelta]
             return times.first_comment_on_first_review.best - times.first_review_request.best
         return None
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once."""
+        first_review_request = times.best["first_review_request"].values
+        first_comment = times.best["first_comment_on_first_review"].values
+        mask = ~np.isnat(first_review_request) & in_interval(first_comment, min_time, max_time)
+        return np.ma.masked_array(first_comment - first_review_request, ~mask)
+
 
 @register(MetricID.PR_OPENED)
 class OpenedCalculator(PullRequestSumMetricCalculator[int]):
@@ -154,6 +213,14 @@ class OpenedCalculator(PullRequestSumMetricCalculator[int]):
             return 1
         return None
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once."""
+        max_time = to_datetime64(max_time)
+        closed = times.best["closed"].values
+        mask = (times.best["created"].values < max_time) & (np.isnat(closed) | (closed > max_time))
+        return np.ma.masked_array(np.ones(len(times), dtype=int), ~mask)
+
 
 @register(MetricID.PR_MERGED)
 class MergedCalculator(PullRequestSumMetricCalculator[int]):
@@ -166,6 +233,13 @@ class MergedCalculator(PullRequestSumMetricCalculator[int]):
             return 1
         return None
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once."""
+        return np.ma.masked_array(
+            np.ones(len(times), dtype=int),
+            ~in_interval(times.best["merged"].values, min_time, max_time))
+
 
 @register(MetricID.PR_CLOSED)
 class ClosedCalculator(PullRequestSumMetricCalculator[int]):
@@ -178,6 +252,13 @@ class ClosedCalculator(PullRequestSumMetricCalculator[int]):
             return 1
         return None
 
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once."""
+        return np.ma.masked_array(
+            np.ones(len(times), dtype=int),
+            ~in_interval(times.best["closed"].values, min_time, max_time))
+
 
 @register(MetricID.PR_FLOW_RATIO)
 class FlowRatioCalculator(PullRequestMetricCalculator[float]):
@@ -206,3 +287,10 @@ class FlowRatioCalculator(PullRequestMetricCalculator[float]):
         self._opened(times, min_time, max_time)
         self._closed(times, min_time, max_time)
         return None
+
+    def analyze_batch(self, times: PullRequestTimesTable, min_time: datetime, max_time: datetime,
+                      ) -> np.ma.MaskedArray:
+        """Calculate the actual state update for many PRs at once."""
+        self._opened(times, min_time, max_time)
+        self._closed(times, min_time, max_time)
+        return np.ma.masked_all(len(times))
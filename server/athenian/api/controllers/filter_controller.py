@@ -1,18 +1,19 @@
 import asyncio
 from collections import defaultdict
 from itertools import chain
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Set, Union
 
 from aiohttp import web
 import aiomcache
 import databases.core
 from sqlalchemy import and_, distinct, or_, select
 
+from athenian.api.controllers.etag import fetch_freshness, gen_etag, respond_with_etag
 from athenian.api.controllers.features.entries import PR_ENTRIES
 from athenian.api.controllers.miners.access_classes import access_classes
 from athenian.api.controllers.miners.pull_request_list_item import ParticipationKind, \
     PullRequestListItem, Stage
-from athenian.api.controllers.reposet import resolve_reposet
+from athenian.api.controllers.reposet import resolve_reposets
 from athenian.api.controllers.reposet_controller import load_account_reposets
 from athenian.api.models.metadata.github import PullRequest, PullRequestCommit, \
     PullRequestReview, PushCommit, User
@@ -126,10 +127,9 @@ async def _resolve_repos(filt: Union[FilterContribsOrReposRequest, FilterPullReq
             filt.account, native_uid, [RepositorySet.id], sdb_conn, mdb_conn, cache)
         filt.in_ = ["{%d}" % rss[0][RepositorySet.id.key]]
         check_access = False
-    repos = set(chain.from_iterable(
-        await asyncio.gather(*[
-            resolve_reposet(r, ".in[%d]" % i, uid, filt.account, sdb_conn, cache)
-            for i, r in enumerate(filt.in_)])))
+    repos = set(chain.from_iterable(await resolve_reposets(
+        filt.in_, [".in[%d]" % i for i in range(len(filt.in_))], uid, filt.account, sdb_conn,
+        cache)))
     prefix = "github.com/"
     repos = [r[r.startswith(prefix) and len(prefix):] for r in repos]
     if check_access:
@@ -156,8 +156,21 @@ async def filter_prs(request: AthenianWebRequest, body: dict) -> web.Response:
         stages = set(Stage)
     participants = {getattr(ParticipationKind, k.upper()): v
                     for k, v in body.get("with", {}).items()}
+    etag = gen_etag("filter_prs", body, sorted(repos), await fetch_freshness(repos, request.mdb))
+    return await respond_with_etag(
+        request, etag, __name__ + ".filter_prs",
+        lambda cache: _filter_prs(filt, repos, stages, participants, request, cache))
+
+
+async def _filter_prs(filt: FilterPullRequestsRequest,
+                      repos: List[str],
+                      stages: Set[Stage],
+                      participants: Dict[ParticipationKind, List[str]],
+                      request: AthenianWebRequest,
+                      cache: Optional[aiomcache.Client],
+                      ) -> web.Response:
     prs = await PR_ENTRIES["github"](
-        filt.date_from, filt.date_to, repos, stages, participants, request.mdb, request.cache)
+        filt.date_from, filt.date_to, repos, stages, participants, request.mdb, cache)
     web_prs = sorted(_web_pr_from_struct(pr) for pr in prs)
     users = {u.split("/", 1)[1] for u in
              chain.from_iterable(chain.from_iterable(pr.participants.values()) for pr in prs)}
@@ -13,8 +13,9 @@ import databases.core
 import pyffx
 from sqlalchemy import and_, delete, func, insert, select, update
 
-from athenian.api.cache import cached
-from athenian.api.controllers.account import get_installation_id, get_user_account_status
+from athenian.api.cache import bump_cache_namespace, cached
+from athenian.api.controllers.account import gen_account_cache_namespace, get_installation_id, \
+    get_user_account_status
 from athenian.api.models.metadata.github import FetchProgress, Installation, InstallationOwner, \
     InstallationRepo
 from athenian.api.models.state.models import Account, Invitation, UserAccount
@@ -148,6 +149,7 @@ async def accept_invitation(request: AthenianWebRequest, body: dict) -> web.Resp
             await conn.execute(insert(UserAccount).values(user.explode(with_primary_keys=True)))
             values = {Invitation.accepted.key: inv[Invitation.accepted.key] + 1}
             await conn.execute(update(Invitation).where(Invitation.id == iid).values(values))
+            await bump_cache_namespace(request.cache, gen_account_cache_namespace(acc_id))
         user = await (await request.user()).load_accounts(conn)
     return response(InvitedUser(account=acc_id, user=user))
 
@@ -1,14 +1,17 @@
 import asyncio
 from collections import defaultdict
+from datetime import date
 from http import HTTPStatus
-from itertools import chain
-from typing import List, Set, Tuple
+from itertools import chain, islice
+from typing import List, Optional, Set, Tuple
 
 from aiohttp import web
+import aiomcache
 
+from athenian.api.controllers.etag import fetch_freshness, gen_etag, respond_with_etag
 from athenian.api.controllers.features.entries import METRIC_ENTRIES
 from athenian.api.controllers.miners.access_classes import access_classes
-from athenian.api.controllers.reposet import resolve_reposet
+from athenian.api.controllers.reposet import resolve_reposets
 from athenian.api.models.metadata import PREFIXES
 from athenian.api.models.web import CalculatedMetric, CalculatedMetrics, CalculatedMetricValues, \
     ForSet, Granularity
@@ -30,6 +33,7 @@ async def calc_metrics_pr_linear(request: AthenianWebRequest, body: dict) -> web
     :param body: Desired metric definitions.
     :type body: dict | bytes
     """
+    raw_body = body
     try:
         body = PullRequestMetricsRequest.from_dict(body)
     except ValueError as e:
@@ -70,27 +74,51 @@ async def calc_metrics_pr_linear(request: AthenianWebRequest, body: dict) -> web
             detail="granularity value is invalid",
             pointer=".granularity",
         )).response
-    for service, (repos, devs, for_set) in filters:
-        calcs = defaultdict(list)
-        # for each filter, we find the functions to measure the metrics
-        sentries = METRIC_ENTRIES[service]
-        for m in body.metrics:
-            calcs[sentries[m]].append(m)
-        results = {}
-        # for each metric, we find the function to calculate and call it
-        for func, metrics in calcs.items():
-            fres = await func(metrics, time_intervals, repos, devs, request.mdb, request.cache)
-            assert len(fres) == len(time_intervals) - 1
-            for i, m in enumerate(metrics):
-                results[m] = [r[i] for r in fres]
+    all_repos = set(chain.from_iterable(repos for _, (repos, _, _) in filters))
+    etag = gen_etag("calc_metrics_pr_linear", raw_body,
+                    [(service, sorted(repos)) for service, (repos, _, _) in filters],
+                    await fetch_freshness(all_repos, request.mdb))
+    return await respond_with_etag(
+        request, etag, __name__ + ".calc_metrics_pr_linear",
+        lambda cache: _calc_metrics(met, filters, time_intervals, request, cache))
+
+
+async def _calc_metrics(met: CalculatedMetrics,
+                        filters: List[Filter],
+                        time_intervals: List[date],
+                        request: AthenianWebRequest,
+                        cache: Optional[aiomcache.Client],
+                        ) -> web.Response:
+    # for each service and metric, we find the function to calculate
+    calcs = defaultdict(list)
+    services = defaultdict(list)
+    for i, (service, _) in enumerate(filters):
+        if service not in services:
+            sentries = METRIC_ENTRIES[service]
+            for m in met.metrics:
+                calcs[(service, sentries[m])].append(m)
+        services[service].append(i)
+    # each function evaluates all the filters of the service at once so that they share the data
+    fress = await asyncio.gather(*(
+        func(metrics, time_intervals,
+             [(filters[i][1][0], filters[i][1][1]) for i in services[service]],
+             request.mdb, cache)
+        for (service, func), metrics in calcs.items()))
+    results = [{} for _ in filters]
+    for ((service, _), metrics), fres in zip(calcs.items(), fress):
+        for i, sres in zip(services[service], fres):
+            assert len(sres) == len(time_intervals) - 1
+            for j, m in enumerate(metrics):
+                results[i][m] = [r[j] for r in sres]
+    for (_, (_, _, for_set)), fresults in zip(filters, results):
         cm = CalculatedMetric(
             for_=for_set,
             values=[CalculatedMetricValues(
                 date=d,
-                values=[results[m][i].value for m in met.metrics],
-                confidence_mins=[results[m][i].confidence_min for m in met.metrics],
-                confidence_maxs=[results[m][i].confidence_max for m in met.metrics],
-                confidence_scores=[results[m][i].confidence_score() for m in met.metrics],
+                values=[fresults[m][i].value for m in met.metrics],
+                confidence_mins=[fresults[m][i].confidence_min for m in met.metrics],
+                confidence_maxs=[fresults[m][i].confidence_max for m in met.metrics],
+                confidence_scores=[fresults[m][i].confidence_score() for m in met.metrics],
             ) for i, d in enumerate(time_intervals[1:])])
         for v in cm.values:
             if sum(1 for c in v.confidence_scores if c is not None) == 0:
@@ -106,15 +134,18 @@ async def _compile_filters(for_sets: List[ForSet], request: AthenianWebRequest,
     filters = []
     sdb, user = request.sdb, request.uid
     checkers = {}
+    refs, pointers = [], []
+    for i, for_set in enumerate(for_sets):
+        for j, ref in enumerate(for_set.repositories):
+            refs.append(ref)
+            pointers.append(".for[%d].repositories[%d]" % (i, j))
+    resolved = iter(await resolve_reposets(refs, pointers, user, account, sdb, request.cache))
     async with sdb.connection() as sdb_conn:
         for i, for_set in enumerate(for_sets):
             repos = set()
             devs = []
             service = None
-            for repo in chain.from_iterable(await asyncio.gather(*[
-                    resolve_reposet(r, ".for[%d].repositories[%d]" % (i, j), user, account, sdb,
-                                    request.cache)
-                    for j, r in enumerate(for_set.repositories)])):
+            for repo in chain.from_iterable(islice(resolved, len(for_set.repositories))):
                 for key, prefix in PREFIXES.items():
                     if repo.startswith(prefix):
                         if service is None:
@@ -29,6 +29,8 @@ class GitHubAccessChecker(AccessChecker):
         deserialize=marshal.loads,
         key=lambda iid, **_: (iid,),
         cache=lambda self, **_: self.cache,
+        l1_size=1024,
+        l1_ttl=60,
     )
     async def _fetch_installed_repos(self, iid: int) -> Set[str]:
         installed_repos_db = await self.mdb.fetch_all(
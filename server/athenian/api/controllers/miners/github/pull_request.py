@@ -1,23 +1,112 @@
+import asyncio
+import contextvars
 from dataclasses import dataclass
-from datetime import date, datetime
+from datetime import date, datetime, timedelta, timezone
 from enum import Enum
-import io
+from itertools import chain
+import os
 import struct
-from typing import Dict, Generator, Generic, List, Mapping, Optional, Sequence, Set, TypeVar, Union
+import time
+from typing import Coroutine, Dict, Generator, Generic, List, Mapping, Optional, Sequence, Set, \
+    Tuple, TypeVar, Union
 
 import aiomcache
 import databases
+import numpy as np
 import pandas as pd
-from sqlalchemy import select, sql
+import pyarrow as pa
+from sqlalchemy import Column, select, sql
+from sqlalchemy.sql import Select
 
-from athenian.api.async_read_sql_query import read_sql_query
-from athenian.api.cache import cached
+from athenian.api.async_read_sql_query import read_sql_query, read_sql_query_chunked
+from athenian.api.cache import gen_cache_key, get_chunked, set_chunked
 from athenian.api.controllers.miners.pull_request_list_item import ParticipationKind, \
     PullRequestListItem, Stage
+from athenian.api.metadata import __package__
 from athenian.api.models.metadata.github import Base, IssueComment, PullRequest, \
     PullRequestComment, PullRequestCommit, PullRequestReview
 
 
+# the index of the codec is written in the header of the cached partitions
+_CACHE_CODECS = (None, "lz4", "zstd")
+_CHILD_MODELS = (PullRequestReview, PullRequestComment, IssueComment, PullRequestCommit)
+# the columns without which we cannot mine: the keys, the timestamps to filter and the PKs
+_REQUIRED_COLUMNS = {
+    PullRequest: {
+        PullRequest.repository_fullname.key, PullRequest.number.key, PullRequest.user_login.key,
+        PullRequest.created_at.key, PullRequest.updated_at.key, PullRequest.closed_at.key,
+    },
+    **{model: {
+        model.repository_fullname.key, model.pull_request_number.key, model.created_at.key,
+        *(c.name for c in model.__table__.primary_key.columns),
+    } for model in _CHILD_MODELS},
+}
+
+
+def _spawn_detached(coro: Coroutine) -> asyncio.Future:
+    """Schedule the coroutine in a new task with an empty context. `db.connection()` remembers \
+    the connection in a context variable which the usual child tasks inherit, so their queries \
+    would share one connection and run serially."""
+    return contextvars.Context().run(asyncio.ensure_future, coro)
+
+
+def _next_month(month: date) -> date:
+    """Return the first day of the next month."""
+    return (month.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _split_months(time_from: date, time_to: date) -> List[date]:
+    """Return the first days of the calendar months which intersect [`time_from`, `time_to`). \
+    There is always at least one month."""
+    months = [time_from.replace(day=1)]
+    while _next_month(months[-1]) < time_to:
+        months.append(_next_month(months[-1]))
+    return months
+
+
+def _to_utc_timestamp(dt: date) -> pd.Timestamp:
+    """Convert the date to a timestamp which is comparable with the datetime columns."""
+    return pd.Timestamp(dt, tz=timezone.utc)
+
+
+def _to_utc(column: pd.Series) -> pd.Series:
+    """Convert the column to datetime64[ns, UTC]. The columns without any value have \
+    the object dtype after `read_sql_query()`."""
+    return pd.to_datetime(column, utc=True, cache=False)
+
+
+def _match_prs(prs: pd.DataFrame, time_from: date, time_to: date, closed_inclusive: bool,
+               ) -> np.ndarray:
+    """Evaluate the PR filter of `PullRequestMiner` in memory.
+
+    :param closed_inclusive: Include the PRs closed exactly at `time_from`.
+    """
+    time_from = _to_utc_timestamp(time_from)
+    time_to = _to_utc_timestamp(time_to)
+    updated = _to_utc(prs[PullRequest.updated_at.key])
+    closed = _to_utc(prs[PullRequest.closed_at.key])
+    mask = closed.isnull() | ((closed >= time_from) if closed_inclusive else (closed > time_from))
+    mask &= _to_utc(prs[PullRequest.created_at.key]) < time_to
+    mask |= (updated >= time_from) & (updated < time_to)
+    return mask.values
+
+
+def _concat_frames(dfs: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate the frames with the same columns. The dtypes of the empty frames and of the \
+    columns without any value in some of the frames are not allowed to spoil the result."""
+    nonempty = [df for df in dfs if not df.empty]
+    if len(nonempty) == 0:
+        return dfs[0]
+    if len(nonempty) == 1:
+        return nonempty[0]
+    result = pd.concat(nonempty, ignore_index=True, sort=False)
+    for col, dtype in result.dtypes.items():
+        if dtype == object and any(isinstance(df[col].dtype, pd.DatetimeTZDtype)
+                                   for df in nonempty):
+            result[col] = _to_utc(result[col])
+    return result
+
+
 @dataclass(frozen=True)
 class MinedPullRequest:
     """All the relevant information we are able to load from the metadata DB about a PR."""
@@ -34,75 +123,99 @@ class PullRequestMiner:
     with individual PR tuples."""
 
     CACHE_TTL = 5 * 60
+    # how long the results computed from the mined PRs may be served while they are refreshed
+    STALE_CACHE_TTL = 60 * 60
+    # maximum number of concurrent queries to the metadata DB per request
+    PARALLEL_QUERIES = int(os.getenv("ATHENIAN_MINER_PARALLEL_QUERIES", "4"))
+    # we load the child rows by a subquery instead of listing the numbers of more PRs
+    MAX_IN_LIST_PRS = 1000
+    # "lz4", "zstd" or None to store the partitions uncompressed
+    CACHE_COMPRESSION = os.getenv("ATHENIAN_MINER_CACHE_COMPRESSION", "lz4") or None
+    # the columns of each model which are used by the particular miner besides \
+    # `_REQUIRED_COLUMNS`; None means all the columns
+    COLUMNS: Optional[Dict[Base, Set[str]]] = None
+    # the superset of `COLUMNS` which we store in the cached partitions; the miners with the same
+    # projection share the partitions; None means `COLUMNS`
+    PARTITION_COLUMNS: Optional[Dict[Base, Set[str]]] = None
 
     def __init__(self, prs: pd.DataFrame, reviews: pd.DataFrame, review_comments: pd.DataFrame,
                  comments: pd.DataFrame, commits: pd.DataFrame):
         """Initialize a new instance of `PullRequestMiner`."""
         self._prs = prs
-        self._reviews = reviews
-        self._review_comments = review_comments
-        self._comments = comments
-        self._commits = commits
+        self._reviews, self._reviews_index = self._index_by_pr(reviews, PullRequestReview)
+        self._review_comments, self._review_comments_index = self._index_by_pr(
+            review_comments, PullRequestComment)
+        self._comments, self._comments_index = self._index_by_pr(comments, IssueComment)
+        self._commits, self._commits_index = self._index_by_pr(commits, PullRequestCommit)
 
-    def _serialize_for_cache(dfs: List[pd.DataFrame]) -> memoryview:
+    def _serialize_for_cache(dfs: List[pd.DataFrame], compression: Optional[str] = None,
+                             ) -> memoryview:
+        """Write each frame as an Arrow IPC stream, append the offsets, and optionally compress \
+        the whole buffer with "lz4" or "zstd"."""
         assert len(dfs) < 256
-        buf = io.BytesIO()
+        sink = pa.BufferOutputStream()
         offsets = []
         for df in dfs:
-            df.to_feather(buf)
-            offsets.append(buf.tell())
-        buf.write(struct.pack("!" + "I" * len(offsets), *offsets))
-        buf.write(struct.pack("!B", len(offsets)))
-        return buf.getbuffer()
+            # no pandas metadata: it is slow to apply and we keep the default index anyway
+            table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata()
+            writer = pa.RecordBatchStreamWriter(sink, table.schema)
+            writer.write_table(table)
+            writer.close()
+            offsets.append(sink.tell())
+        sink.write(struct.pack("!" + "I" * len(offsets), *offsets))
+        sink.write(struct.pack("!B", len(offsets)))
+        body = sink.getvalue()
+        header = struct.pack("!BQ", _CACHE_CODECS.index(compression), body.size)
+        if compression is not None:
+            body = pa.compress(body, codec=compression, asbytes=False)
+        buf = bytearray(len(header) + body.size)
+        buf[:len(header)] = header
+        buf[len(header):] = memoryview(body)
+        return memoryview(buf)
 
     def _deserialize_from_cache(data: bytes) -> List[pd.DataFrame]:
-        data = memoryview(data)
-        size = struct.unpack("!B", data[-1:])[0]
-        offsets = (0,) + struct.unpack("!" + "I" * size, data[-size * 4 - 1:-1])
+        buf = pa.py_buffer(data)
+        header_size = struct.calcsize("!BQ")
+        codec, size = struct.unpack("!BQ", buf.slice(0, header_size))
+        body = buf.slice(header_size)
+        if codec > 0:
+            body = pa.decompress(body, decompressed_size=size, codec=_CACHE_CODECS[codec],
+                                 asbytes=False)
+        trailer = memoryview(body)
+        count = trailer[-1]
+        offsets = (0,) + struct.unpack("!" + "I" * count, trailer[-count * 4 - 1:-1])
         dfs = []
         for beg, end in zip(offsets, offsets[1:]):
-            buf = io.BytesIO(data[beg:end])
-            dfs.append(pd.read_feather(buf))
+            reader = pa.RecordBatchStreamReader(body.slice(beg, end - beg))
+            dfs.append(reader.read_all().to_pandas())
         return dfs
 
     @classmethod
-    @cached(
-        exptime=lambda cls, **_: cls.CACHE_TTL,
-        serialize=_serialize_for_cache,
-        deserialize=_deserialize_from_cache,
-        key=lambda time_from, time_to, repositories, developers, **_: (
-            time_from.toordinal(),
-            time_to.toordinal(),
-            ",".join(sorted(repositories)),
-            ",".join(sorted(developers)),
-        ),
-    )
     async def _mine(cls, time_from: date, time_to: date, repositories: Sequence[str],
                     developers: Sequence[str], db: databases.Database,
                     cache: Optional[aiomcache.Client]) -> List[pd.DataFrame]:
-        filters = [
-            sql.or_(sql.and_(PullRequest.updated_at >= time_from,
-                             PullRequest.updated_at < time_to),
-                    sql.and_(sql.or_(PullRequest.closed_at.is_(None),
-                                     PullRequest.closed_at > time_from),
-                             PullRequest.created_at < time_to)),
-            PullRequest.repository_fullname.in_(repositories),
-        ]
-        if len(developers) > 0:
-            filters.append(PullRequest.user_login.in_(developers))
-        async with db.connection() as conn:
-            prs = await read_sql_query(select([PullRequest]).where(sql.and_(*filters)),
-                                       conn, PullRequest)
-            numbers = prs[PullRequest.number.key] if len(prs) > 0 else set()
-            reviews = await cls._read_filtered_models(
-                conn, PullRequestReview, numbers, repositories, time_to)
-            review_comments = await cls._read_filtered_models(
-                conn, PullRequestComment, numbers, repositories, time_to)
-            comments = await cls._read_filtered_models(
-                conn, IssueComment, numbers, repositories, time_to)
-            commits = await cls._read_filtered_models(
-                conn, PullRequestCommit, numbers, repositories, time_to)
-        return [prs, reviews, review_comments, comments, commits]
+        """
+        Load the PRs and the related child rows from the metadata DB or from the cache.
+
+        The cache is partitioned by (repository, calendar month) so that the overlapping \
+        requests share the partitions and we query the DB only for the missing ones. \
+        The partitions contain the PRs of all the developers, so we filter by `developers` \
+        in memory and the requests which differ only by the developers share the partitions, too.
+        """
+        dfs = await cls._mine_unfiltered(time_from, time_to, repositories, developers, db, cache)
+        return cls._filter_frames(dfs, time_from, time_to, repositories, developers)
+
+    @classmethod
+    async def _mine_unfiltered(cls, time_from: date, time_to: date,
+                               repositories: Sequence[str], developers: Sequence[str],
+                               db: databases.Database, cache: Optional[aiomcache.Client],
+                               ) -> List[pd.DataFrame]:
+        """Load the superset of the PRs and the related child rows which `_filter_frames()` \
+        must narrow down."""
+        if cache is None:
+            return await cls._fetch(time_from, time_to, repositories, developers, db)
+        return await cls._mine_partitions(
+            _split_months(time_from, time_to), sorted(set(repositories)), db, cache)
 
     _serialize_for_cache = staticmethod(_serialize_for_cache)
     _deserialize_from_cache = staticmethod(_deserialize_from_cache)
@@ -124,36 +237,271 @@ class PullRequestMiner:
         dfs = await cls._mine(time_from, time_to, repositories, developers, db, cache)
         return cls(*dfs)
 
+    @classmethod
+    async def mine_many(cls, time_from: date, time_to: date,
+                        filters: Sequence[Tuple[Sequence[str], Sequence[str]]],
+                        db: databases.Database, cache: Optional[aiomcache.Client],
+                        ) -> List["PullRequestMiner"]:
+        """
+        Create a new `PullRequestMiner` for each (repositories, developers) pair in `filters`.
+
+        We mine the union of the filters once and split it in memory, so the overlapping \
+        filters do not load the same PRs several times. The other arguments are the same as in \
+        `mine()`.
+        """
+        repositories = sorted(set(chain.from_iterable(repos for repos, _ in filters)))
+        if any(len(devs) == 0 for _, devs in filters):
+            developers = []
+        else:
+            developers = sorted(set(chain.from_iterable(devs for _, devs in filters)))
+        dfs = await cls._mine_unfiltered(time_from, time_to, repositories, developers, db, cache)
+        return [cls(*cls._filter_frames(dfs, time_from, time_to, repos, devs))
+                for repos, devs in filters]
+
+    @classmethod
+    async def _fetch(cls, time_from: date, time_to: date, repositories: Sequence[str],
+                     developers: Sequence[str], db: databases.Database,
+                     for_partitions: bool = False) -> List[pd.DataFrame]:
+        """
+        Query the metadata DB.
+
+        The PRs closed exactly at `time_from` are included so that the result covers every \
+        (repository, month) partition inside [`time_from`, `time_to`).
+
+        :param for_partitions: Load the child rows created after `time_to`, too, and \
+                               the columns of `PARTITION_COLUMNS`.
+        """
+        children_time_to = None if for_partitions else time_to
+        filters = [
+            sql.or_(sql.and_(PullRequest.updated_at >= time_from,
+                             PullRequest.updated_at < time_to),
+                    sql.and_(sql.or_(PullRequest.closed_at.is_(None),
+                                     PullRequest.closed_at >= time_from),
+                             PullRequest.created_at < time_to)),
+            PullRequest.repository_fullname.in_(repositories),
+        ]
+        if len(developers) > 0:
+            filters.append(PullRequest.user_login.in_(developers))
+        async with db.connection() as conn:
+            columns = cls._columns(PullRequest, for_partitions)
+            prs = await read_sql_query(select(columns).where(sql.and_(*filters)), conn, columns)
+            if len(prs) <= cls.MAX_IN_LIST_PRS:
+                prs_filter = prs[PullRequest.number.key] if len(prs) > 0 else set()
+            else:
+                # the IN list would be huge, let the DB select the same PRs again instead
+                prs_filter = select([PullRequest.repository_fullname, PullRequest.number]) \
+                    .where(sql.and_(*filters))
+            if cls.PARALLEL_QUERIES <= 1:
+                children = [await cls._read_filtered_models(
+                    conn, model, cls._columns(model, for_partitions), prs_filter, repositories,
+                    children_time_to)
+                    for model in _CHILD_MODELS]
+                return [prs, *children]
+        # the child queries are independent, so we run them on separate connections
+        semaphore = asyncio.Semaphore(cls.PARALLEL_QUERIES)
+
+        async def read_children(model: Base) -> pd.DataFrame:
+            async with semaphore, db.connection() as conn:
+                return await cls._read_filtered_models(
+                    conn, model, cls._columns(model, for_partitions), prs_filter, repositories,
+                    children_time_to)
+
+        children = await asyncio.gather(*(
+            _spawn_detached(read_children(model)) for model in _CHILD_MODELS))
+        return [prs, *children]
+
+    @classmethod
+    async def _mine_partitions(cls, months: List[date], repositories: List[str],
+                               db: databases.Database, cache: aiomcache.Client,
+                               ) -> List[pd.DataFrame]:
+        """Load the (repository, month) partitions from the cache, fetch the missing ones from \
+        the DB, store them in the cache, and concatenate all the partitions."""
+        start_time = time.time()
+        full_name = cls.__module__ + "." + cls.__qualname__ + "._mine_partition"
+        models = (PullRequest, *_CHILD_MODELS)
+        # the miners with the same projection share the partitions
+        projection = ",".join("%s.%s" % (model.__tablename__, c.name)
+                              for model in models for c in cls._columns(model, True))
+        # the payload format is a part of the key so that we never read the incompatible items
+        keys = {(repo, month): gen_cache_key(
+            "%s._mine_partition|%s|%s|%d|all_children|arrow",
+            __name__, projection, repo, month.toordinal())
+            for repo in repositories for month in months}
+        buffers = await asyncio.gather(*(get_chunked(cache, key) for key in keys.values()))
+        partitions = {}
+        for part, buffer in zip(keys, buffers):
+            if buffer is not None:
+                deserialize_start_time = time.time()
+                partitions[part] = cls._deserialize_from_cache(buffer)
+                cache.metrics["deserialization_time"].labels(__package__, full_name).observe(
+                    time.time() - deserialize_start_time)
+        hits = len(partitions)
+        misses = len(keys) - hits
+        cache.metrics["hits"].labels(__package__, full_name).inc(hits)
+        cache.metrics["misses"].labels(__package__, full_name).inc(misses)
+        if misses > 0:
+            missing_months = sorted({month for _, month in keys.keys() - partitions.keys()})
+            missing_repos = sorted({repo for repo, _ in keys.keys() - partitions.keys()})
+            # we fetch everything in one go and then split by the partitions in memory;
+            # a PR can receive children after the last month it matches, so the partitions
+            # keep all the existing children and `_filter_frames()` cuts them by the request
+            fetch_months = [m for m in months if missing_months[0] <= m <= missing_months[-1]]
+            dfs = await cls._fetch(fetch_months[0], _next_month(fetch_months[-1]),
+                                   missing_repos, [], db, for_partitions=True)
+            fresh = cls._split_partitions(dfs, fetch_months, missing_repos)
+            payloads = {}
+            for part, part_dfs in fresh.items():
+                serialize_start_time = time.time()
+                payloads[part] = cls._serialize_for_cache(part_dfs, cls.CACHE_COMPRESSION)
+                cache.metrics["serialization_time"].labels(__package__, full_name).observe(
+                    time.time() - serialize_start_time)
+                cache.metrics["payload_size"].labels(__package__, full_name).observe(
+                    len(payloads[part]))
+            await asyncio.gather(*(
+                set_chunked(cache, keys[part], payload, cls.CACHE_TTL, full_name)
+                for part, payload in payloads.items()))
+            partitions.update(fresh)
+        dfs = [_concat_frames([partitions[part][i] for part in keys]) for i in range(5)]
+        if cls.PARTITION_COLUMNS is not None:
+            dfs = [df[[c.name for c in cls._columns(model)]] for df, model in zip(dfs, models)]
+        latency = "miss_latency" if misses > 0 else "hit_latency"
+        cache.metrics[latency].labels(__package__, full_name).observe(time.time() - start_time)
+        return dfs
+
+    @staticmethod
+    def _split_partitions(dfs: List[pd.DataFrame], months: List[date], repositories: List[str],
+                          ) -> Dict[Tuple[str, date], List[pd.DataFrame]]:
+        """Split the fetched frames by (repository, month). Each partition contains all the \
+        fetched child rows of its PRs regardless of their creation time."""
+        prs, *children = dfs
+        prs_repos = prs[PullRequest.repository_fullname.key].values
+        children_keys = [pd.MultiIndex.from_arrays([
+            df[model.repository_fullname.key].values, df[model.pull_request_number.key].values,
+        ]) for df, model in zip(children, _CHILD_MODELS)]
+        partitions = {}
+        for month in months:
+            month_mask = _match_prs(prs, month, _next_month(month), True)
+            for repo in repositories:
+                part_prs = prs.take(np.flatnonzero(month_mask & (prs_repos == repo)))
+                part_keys = pd.MultiIndex.from_arrays([
+                    part_prs[PullRequest.repository_fullname.key].values,
+                    part_prs[PullRequest.number.key].values,
+                ])
+                part_dfs = [part_prs.reset_index(drop=True)]
+                for df, keys in zip(children, children_keys):
+                    part_dfs.append(df.take(np.flatnonzero(keys.isin(part_keys)))
+                                    .reset_index(drop=True))
+                partitions[(repo, month)] = part_dfs
+        return partitions
+
+    @staticmethod
+    def _filter_frames(dfs: List[pd.DataFrame], time_from: date, time_to: date,
+                       repositories: Sequence[str], developers: Sequence[str],
+                       ) -> List[pd.DataFrame]:
+        """Apply the exact request filters to the rows fetched or assembled from the partitions \
+        and remove the duplicates."""
+        prs, *children = dfs
+        repo_key = PullRequest.repository_fullname.key
+        number_key = PullRequest.number.key
+        if prs[[repo_key, number_key]].duplicated().any():
+            # the same PR can be in several partitions, take the most recent version
+            prs = prs.take(np.argsort(_to_utc(prs[PullRequest.updated_at.key]).values,
+                                      kind="stable"))
+            prs = prs.drop_duplicates([repo_key, number_key], keep="last").sort_index()
+        mask = _match_prs(prs, time_from, time_to, False) & prs[repo_key].isin(repositories).values
+        if len(developers) > 0:
+            mask &= prs[PullRequest.user_login.key].isin(developers).values
+        prs = prs.take(np.flatnonzero(mask))
+        prs.reset_index(drop=True, inplace=True)
+        keys = pd.MultiIndex.from_arrays([prs[repo_key].values, prs[number_key].values])
+        result = [prs]
+        for df, model in zip(children, _CHILD_MODELS):
+            df = df.drop_duplicates([c.name for c in model.__table__.primary_key.columns])
+            mask = (_to_utc(df[model.created_at.key]) < _to_utc_timestamp(time_to)).values
+            mask &= pd.MultiIndex.from_arrays([
+                df[model.repository_fullname.key].values, df[model.pull_request_number.key].values,
+            ]).isin(keys)
+            result.append(df.take(np.flatnonzero(mask)).reset_index(drop=True))
+        return result
+
     @staticmethod
     async def _read_filtered_models(conn: databases.core.Connection,
                                     model_cls: Base,
-                                    numbers: Sequence[str],
+                                    columns: List[Column],
+                                    prs: Union[Sequence[int], Select],
                                     repositories: Sequence[str],
-                                    time_to: date,
+                                    time_to: Optional[date],
                                     ) -> pd.DataFrame:
-        time_to = datetime.combine(time_to, datetime.min.time())
-        return await read_sql_query(select([model_cls]).where(
-            sql.and_(model_cls.pull_request_number.in_(numbers),
-                     model_cls.repository_fullname.in_(repositories),
-                     model_cls.created_at < time_to)),
-            conn, model_cls)
+        """
+        Load the child rows of the specified PRs.
+
+        :param columns: Columns of `model_cls` to load.
+        :param prs: Either the PR numbers or the query which selects \
+                    (repository_fullname, number) of the PRs. The former may load the rows of \
+                    other PRs with the same numbers in `repositories`, the latter is exact.
+        :param time_to: Load the rows created before this date. None means no limit.
+        """
+        if isinstance(prs, Select):
+            filters = [sql.tuple_(model_cls.repository_fullname,
+                                  model_cls.pull_request_number).in_(prs)]
+        else:
+            filters = [model_cls.pull_request_number.in_(prs),
+                       model_cls.repository_fullname.in_(repositories)]
+        if time_to is not None:
+            filters.append(
+                model_cls.created_at < datetime.combine(time_to, datetime.min.time()))
+        query = select(columns).where(sql.and_(*filters))
+        if not isinstance(prs, Select):
+            return await read_sql_query(query, conn, columns)
+        # there are many PRs and potentially very many child rows, decode them chunk by chunk
+        async with read_sql_query_chunked(query, conn, columns) as chunks:
+            return _concat_frames([df async for df in chunks])
+
+    @classmethod
+    def _columns(cls, model: Base, partition: bool = False) -> List[Column]:
+        """Return the columns of `model` which we load from the metadata DB.
+
+        :param partition: Return the columns which we store in the cached partitions.
+        """
+        projection = cls.COLUMNS
+        if partition and cls.PARTITION_COLUMNS is not None:
+            projection = cls.PARTITION_COLUMNS
+        if projection is None:
+            return list(model.__table__.columns)
+        names = _REQUIRED_COLUMNS[model].union(projection.get(model, ()))
+        return [c for c in model.__table__.columns if c.name in names]
+
+    @staticmethod
+    def _index_by_pr(df: pd.DataFrame, model: Base,
+                     ) -> Tuple[pd.DataFrame, Dict[Tuple[str, int], Tuple[int, int]]]:
+        """
+        Group the rows of `df` by (repository_fullname, pull_request_number).
+
+        :return: Rearranged `df` so that each group is contiguous and the mapping from \
+                 (repository_fullname, pull_request_number) to the [begin, end) row positions. \
+                 The original order of the rows inside each group is preserved.
+        """
+        if df.empty:
+            return df, {}
+        groups = df.groupby([model.repository_fullname.key, model.pull_request_number.key],
+                            sort=False).indices
+        offsets = np.zeros(len(groups) + 1, dtype=int)
+        np.cumsum([len(v) for v in groups.values()], out=offsets[1:])
+        df = df.take(np.concatenate(list(groups.values()))).reset_index(drop=True)
+        return df, {k: (beg, end) for k, beg, end in zip(groups, offsets[:-1], offsets[1:])}
 
     def __iter__(self) -> Generator[MinedPullRequest, None, None]:
         """Iterate over the individual pull requests."""
         number_key = PullRequest.number.key
         repo_key = PullRequest.repository_fullname.key
+        children = [(getattr(self, "_" + k), getattr(self, "_%s_index" % k))
+                    for k in ("reviews", "review_comments", "comments", "commits")]
         for _, pr in self._prs.iterrows():
-            pr_number = pr[number_key]
-            pr_repo = pr[repo_key]
+            pr_key = pr[repo_key], pr[number_key]
             items = []
-            for k, model in (("reviews", PullRequestReview),
-                             ("review_comments", PullRequestComment),
-                             ("comments", IssueComment),
-                             ("commits", PullRequestCommit)):
-                attr = getattr(self, "_" + k)
-                items.append(attr[
-                    (attr[model.pull_request_number.key] == pr_number) &  # noqa: W504
-                    (attr[model.repository_fullname.key] == pr_repo)])
+            for df, index in children:
+                beg, end = index.get(pr_key, (0, 0))
+                items.append(df.iloc[beg:end])
             yield MinedPullRequest(pr, *items)
 
 
@@ -247,6 +595,42 @@ class PullRequestTimes:
     released: Fallback[DT]                               # PR_R
 
 
+@dataclass(frozen=True)
+class PullRequestTimesTable:
+    """
+    Columnar `PullRequestTimes` of many pull requests.
+
+    Each column is named after the corresponding `PullRequestTimes` field, "work_began" is \
+    included, too. The rows follow the order of the mined PRs.
+    """
+
+    best: pd.DataFrame       # `Fallback.best`-s, datetime64[ns, UTC], NaT means None
+    has_value: pd.DataFrame  # whether the primary `Fallback.value` exists, bool
+
+    def __len__(self) -> int:
+        """Return the number of pull requests."""
+        return len(self.best)
+
+    def take(self, indexes: np.ndarray) -> "PullRequestTimesTable":
+        """Select the pull requests at the specified positions."""
+        return PullRequestTimesTable(best=self.best.take(indexes),
+                                     has_value=self.has_value.take(indexes))
+
+    @classmethod
+    def from_times(cls, items: Sequence[PullRequestTimes]) -> "PullRequestTimesTable":
+        """Convert several `PullRequestTimes` to the columnar representation."""
+        fields = list(PullRequestTimes.__dataclass_fields__) + ["work_began"]
+        best = {}
+        has_value = {}
+        for field in fields:
+            column = [getattr(item, field) for item in items]
+            best[field] = pd.to_datetime([v.best for v in column], utc=True)
+            has_value[field] = np.fromiter((v.value is not None for v in column),
+                                           dtype=bool, count=len(column))
+        return cls(best=pd.DataFrame(best, columns=fields),
+                   has_value=pd.DataFrame(has_value, columns=fields))
+
+
 class ReviewResolution(Enum):
     """Possible review "state"-s in the metadata DB."""
 
@@ -258,6 +642,11 @@ class ReviewResolution(Enum):
 class PullRequestTimesMiner(PullRequestMiner):
     """Extract the pull request update timestamps from the metadata DB."""
 
+    COLUMNS = {
+        PullRequest: {PullRequest.merged_at.key},
+        PullRequestReview: {PullRequestReview.user_id.key, PullRequestReview.state.key},
+    }
+
     def _compile(self, pr: MinedPullRequest) -> PullRequestTimes:
         created_at = Fallback(pr.pr[PullRequest.created_at.key], None)
         merged_at = Fallback(pr.pr[PullRequest.merged_at.key], None)
@@ -328,10 +717,189 @@ class PullRequestTimesMiner(PullRequestMiner):
             closed=closed_at,
         )
 
+    def to_table(self) -> PullRequestTimesTable:
+        """
+        Calculate `PullRequestTimes` of all the pull requests at once.
+
+        The logic is the same as in `_compile()` but the timestamps are reduced over the grouped \
+        child rows with NumPy instead of looping over individual PRs.
+        """
+        prs = self._prs
+        n = len(prs)
+        created = _to_ns(prs[PullRequest.created_at.key])
+        merged = _to_ns(prs[PullRequest.merged_at.key])
+        closed = _to_ns(prs[PullRequest.closed_at.key])
+        commits, commits_pos = self._locate_prs(self._commits, PullRequestCommit)
+        commit_dates = _to_ns(commits[PullRequestCommit.commit_date.key])
+        first_commit = _reduce_by_pr(commit_dates, commits_pos, n, np.minimum)
+        last_commit = _reduce_by_pr(commit_dates, commits_pos, n, np.maximum)
+        reviews, reviews_pos = self._locate_prs(self._reviews, PullRequestReview)
+        review_dates = _to_ns(reviews[PullRequestReview.submitted_at.key])
+        review_comments, review_comments_pos = self._locate_prs(
+            self._review_comments, PullRequestComment)
+        first_comment_on_first_review = _nat_min(
+            _reduce_by_pr(_to_ns(review_comments[PullRequestComment.created_at.key]),
+                          review_comments_pos, n, np.minimum),
+            _reduce_by_pr(review_dates, reviews_pos, n, np.minimum))
+        first_comment_on_first_review_best = _nat_fallback(first_comment_on_first_review, merged)
+        reviewed = first_comment_on_first_review_best != _NAT
+        mask = _nat_le(commit_dates, first_comment_on_first_review_best[commits_pos])
+        last_commit_before_first_review = np.where(
+            reviewed,
+            _reduce_by_pr(commit_dates[mask], commits_pos[mask], n, np.maximum),
+            last_commit)
+        last_commit_before_first_review_best = np.where(
+            reviewed,
+            _nat_fallback(last_commit_before_first_review, first_comment_on_first_review_best),
+            last_commit)
+        # force pushes that were lost
+        first_commit = np.where(
+            reviewed, _nat_min(first_commit, last_commit_before_first_review_best), first_commit)
+        last_commit = np.where(reviewed, _nat_max(last_commit, first_commit), last_commit)
+        first_review_request = _nat_min(
+            _nat_max(created, last_commit_before_first_review_best),
+            first_comment_on_first_review_best)  # FIXME(vmarkovtsev): no review request info
+        mask = (closed[reviews_pos] == _NAT) | _nat_le(review_dates, closed[reviews_pos])
+        last_review = _reduce_by_pr(review_dates[mask], reviews_pos[mask], n, np.maximum)
+        mask = (merged[reviews_pos] == _NAT) | _nat_le(review_dates, merged[reviews_pos])
+        approved = self._calc_approved(reviews[mask], reviews_pos[mask], review_dates[mask], n)
+        approved_best = _nat_fallback(approved, merged)
+        finalized = _nat_min(_nat_max(approved_best, last_commit, created), closed)
+        nat = np.full(n, _NAT)
+        columns = {
+            "created": (created, created),
+            "first_commit": (first_commit, first_commit),
+            "last_commit_before_first_review": (last_commit_before_first_review,
+                                                last_commit_before_first_review_best),
+            "last_commit": (last_commit, last_commit),
+            "merged": (merged, merged),
+            "closed": (closed, closed),
+            "first_comment_on_first_review": (first_comment_on_first_review,
+                                              first_comment_on_first_review_best),
+            "first_review_request": (nat, first_review_request),
+            "approved": (approved, approved_best),
+            "last_review": (last_review, last_review),
+            "first_passed_checks": (nat, nat),  # FIXME(vmarkovtsev): no CI info
+            "last_passed_checks": (nat, nat),  # FIXME(vmarkovtsev): no CI info
+            "finalized": (finalized, finalized),
+            "released": (nat, nat),  # FIXME(vmarkovtsev): no releases
+        }
+        work_began = _nat_min(created, first_commit)
+        columns["work_began"] = work_began, work_began
+        return PullRequestTimesTable(
+            best=pd.DataFrame({k: pd.DatetimeIndex(v[1].view("datetime64[ns]"), tz=timezone.utc)
+                               for k, v in columns.items()}),
+            has_value=pd.DataFrame({k: v[0] != _NAT for k, v in columns.items()}),
+        )
+
+    def _locate_prs(self, df: pd.DataFrame, model: Base) -> Tuple[pd.DataFrame, np.ndarray]:
+        """Find the position of the owning PR for each row in `df`. Rows without the owner \
+        are discarded."""
+        if df.empty or self._prs.empty:
+            return df.iloc[:0], np.array([], dtype=int)
+        pos = pd.MultiIndex.from_arrays([
+            self._prs[PullRequest.repository_fullname.key].values,
+            self._prs[PullRequest.number.key].values,
+        ]).get_indexer(pd.MultiIndex.from_arrays([
+            df[model.repository_fullname.key].values,
+            df[model.pull_request_number.key].values,
+        ]))
+        found = pos >= 0
+        return df[found], pos[found]
+
+    @staticmethod
+    def _calc_approved(reviews: pd.DataFrame, reviews_pos: np.ndarray, review_dates: np.ndarray,
+                       n: int) -> np.ndarray:
+        """Apply the rule in `_compile()` to all the PRs: take the first review of each reviewer, \
+        discard the PR if there are requested changes, otherwise take the latest approval."""
+        order = review_dates.copy()
+        order[order == _NAT] = _NAT_MAX  # NaT-s go last as in sort_values()
+        grouped_reviews = pd.DataFrame({
+            "pos": reviews_pos,
+            "user": reviews[PullRequestReview.user_id.key].values,
+            "state": reviews[PullRequestReview.state.key].values,
+            "date": review_dates,
+            "order": order,
+        }).sort_values("order", kind="mergesort").drop_duplicates(["pos", "user"])
+        states = grouped_reviews["state"].values
+        approvals = grouped_reviews[states == ReviewResolution.APPROVED.name]
+        approved = _reduce_by_pr(approvals["date"].values, approvals["pos"].values, n, np.maximum)
+        # merged with negative reviews
+        approved[grouped_reviews["pos"].values[
+            states == ReviewResolution.CHANGES_REQUESTED.name]] = _NAT
+        return approved
+
     def __iter__(self) -> Generator[PullRequestTimes, None, None]:
         """Iterate over the individual pull requests."""
-        for pr in super().__iter__():
-            yield self._compile(pr)
+        table = self.to_table()
+        fields = list(PullRequestTimes.__dataclass_fields__)
+        columns = []
+        for field in fields:
+            best = [(None if ts is pd.NaT else ts) for ts in table.best[field]]
+            has_value = table.has_value[field].values
+            columns.append((best, has_value))
+        for i in range(len(table)):
+            yield PullRequestTimes(**{
+                field: Fallback(best[i] if has_value[i] else None, best[i])
+                for field, (best, has_value) in zip(fields, columns)})
+
+
+_NAT = np.datetime64("NaT").view(np.int64)
+_NAT_MAX = np.iinfo(np.int64).max
+
+
+def _to_ns(column: pd.Series) -> np.ndarray:
+    """Convert a datetime column to UTC nanoseconds since the epoch, NaT-s are kept as `_NAT`."""
+    if not pd.api.types.is_datetime64_any_dtype(column):
+        column = pd.to_datetime(column, utc=True)
+    return column.values.astype("datetime64[ns]").view(np.int64)
+
+
+def _nat_min(*columns: np.ndarray) -> np.ndarray:
+    """Calculate the elementwise minimum of several timestamp columns skipping NaT-s."""
+    stacked = np.vstack(columns)
+    stacked[stacked == _NAT] = _NAT_MAX
+    result = stacked.min(axis=0)
+    result[result == _NAT_MAX] = _NAT
+    return result
+
+
+def _nat_max(*columns: np.ndarray) -> np.ndarray:
+    """Calculate the elementwise maximum of several timestamp columns skipping NaT-s."""
+    # NaT is the smallest int64 so it loses unless everything is NaT
+    return np.vstack(columns).max(axis=0)
+
+
+def _nat_fallback(value: np.ndarray, fallback: np.ndarray) -> np.ndarray:
+    """Vectorized `Fallback.best`."""
+    return np.where(value != _NAT, value, fallback)
+
+
+def _nat_le(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Compare two timestamp columns as `<=`, anything compared with NaT is False."""
+    return (left <= right) & (left != _NAT) & (right != _NAT)
+
+
+def _reduce_by_pr(values: np.ndarray, pos: np.ndarray, n: int, ufunc: np.ufunc) -> np.ndarray:
+    """
+    Aggregate the timestamps of the child rows by the PR positions.
+
+    :param values: Timestamps of the child rows as produced by `_to_ns()`.
+    :param pos: Position of the PR for each child row.
+    :param n: Number of PRs.
+    :param ufunc: Either `np.minimum` or `np.maximum`.
+    :return: Aggregated timestamp for each PR, `_NAT` for PRs without valid child rows.
+    """
+    result = np.full(n, _NAT)
+    valid = values != _NAT
+    if not valid.any():
+        return result
+    values, pos = values[valid], pos[valid]
+    order = np.argsort(pos, kind="mergesort")
+    values, pos = values[order], pos[order]
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(pos)) + 1])
+    result[pos[starts]] = ufunc.reduceat(values, starts)
+    return result
 
 
 def dtmin(first: Union[DT, float], second: Union[DT, float]) -> DT:
@@ -348,6 +916,21 @@ def dtmin(first: Union[DT, float], second: Union[DT, float]) -> DT:
 class PullRequestListMiner(PullRequestTimesMiner):
     """Collect various PR metadata for displaying PRs on the frontend."""
 
+    COLUMNS = {
+        PullRequest: {
+            PullRequest.merged_at.key, PullRequest.merged_by_login.key, PullRequest.title.key,
+            PullRequest.additions.key, PullRequest.deletions.key, PullRequest.changed_files.key,
+        },
+        PullRequestReview: {
+            PullRequestReview.user_id.key, PullRequestReview.state.key,
+            PullRequestReview.user_login.key,
+        },
+        IssueComment: {IssueComment.user_login.key},
+        PullRequestCommit: {
+            PullRequestCommit.commiter_login.key, PullRequestCommit.author_login.key,
+        },
+    }
+
     def __init__(self, prs: pd.DataFrame, reviews: pd.DataFrame, review_comments: pd.DataFrame,
                  comments: pd.DataFrame, commits: pd.DataFrame):
         """Initialize a new instance of `PullRequestListMiner`."""
@@ -445,3 +1028,7 @@ class PullRequestListMiner(PullRequestTimesMiner):
             item = self._compile(pr)
             if item is not None:
                 yield item
+
+
+# the list miner's projection is a superset of the times miner's, so they share the partitions
+PullRequestTimesMiner.PARTITION_COLUMNS = PullRequestListMiner.COLUMNS
@@ -1,3 +1,4 @@
+import pickle
 from typing import List, Optional, Sequence, Tuple, Type, Union
 
 import aiomcache
@@ -5,45 +6,88 @@ import databases
 from sqlalchemy import select
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 
-from athenian.api.controllers.account import get_user_account_status
+from athenian.api.cache import cached_batch
+from athenian.api.controllers.account import gen_account_cache_namespace, \
+    get_user_account_status, get_user_account_statuses
 from athenian.api.models.state.models import RepositorySet
 from athenian.api.models.web import ForbiddenError, InvalidRequestError, NotFoundError
 from athenian.api.response import ResponseError
 
 
-async def resolve_reposet(repo: str,
-                          pointer: str,
-                          uid: str,
+async def resolve_reposets(repos: Sequence[str],
+                           pointers: Sequence[str],
+                           uid: str,
+                           account: int,
+                           db: Union[databases.core.Connection, databases.Database],
+                           cache: Optional[aiomcache.Client],
+                           ) -> List[List[str]]:
+    """
+    Dereference the repository sets.
+
+    If `repos[i]` is a regular repository, the i-th result is `[repos[i]]`. Otherwise, it is \
+    the list of repositories by the parsed ID from the database. `pointers[i]` is the location \
+    of `repos[i]` in the request to report the errors. We load all the sets in one batch.
+    """
+    set_ids = {}
+    for i, (repo, pointer) in enumerate(zip(repos, pointers)):
+        if not repo.startswith("{"):
+            continue
+        if not repo.endswith("}"):
+            raise ResponseError(InvalidRequestError(
+                detail="repository set format is invalid: %s" % repo,
+                pointer=pointer,
+            ))
+        try:
+            set_ids[i] = int(repo[1:-1])
+        except ValueError:
+            raise ResponseError(InvalidRequestError(
+                detail="repository set identifier is invalid: %s" % repo,
+                pointer=pointer,
+            ))
+    resolved = [[repo] for repo in repos]
+    if not set_ids:
+        return resolved
+    reposets = await _fetch_reposets(list(set_ids.values()), account, db, cache)
+    # the user must be a member of every owner account
+    await get_user_account_statuses(
+        uid, list(dict.fromkeys(owner for owner, _ in reposets)), db, cache)
+    for (i, set_id), (owner, items) in zip(set_ids.items(), reposets):
+        if owner != account:
+            raise ResponseError(ForbiddenError(
+                detail="User %s is not allowed to reference reposet %d in this query" %
+                       (uid, set_id)))
+        resolved[i] = items
+    return resolved
+
+
+@cached_batch(
+    # the writes to the reposets bump the account's namespace, so the TTL can be long
+    exptime=24 * 3600,
+    serialize=pickle.dumps,
+    deserialize=pickle.loads,
+    key=lambda set_id, **_: (set_id,),
+    batch="ids",
+    namespace=lambda set_id, account, **_: gen_account_cache_namespace(account),
+)
+async def _fetch_reposets(ids: Sequence[int],
                           account: int,
-                          db: Union[databases.core.Connection, databases.Database],
+                          sdb: Union[databases.Database, databases.core.Connection],
                           cache: Optional[aiomcache.Client],
-                          ) -> List[str]:
+                          ) -> List[Tuple[int, List[str]]]:
     """
-    Dereference the repository sets.
+    Load the owners and the items of the repository sets.
 
-    If `repo` is a regular repository, return `[repo]`. Otherwise, return the list of \
-    repositories by the parsed ID from the database.
+    `account` is the account which is expected to own the sets, it selects the cache namespace.
     """
-    if not repo.startswith("{"):
-        return [repo]
-    if not repo.endswith("}"):
-        raise ResponseError(InvalidRequestError(
-            detail="repository set format is invalid: %s" % repo,
-            pointer=pointer,
-        ))
-    try:
-        set_id = int(repo[1:-1])
-    except ValueError:
-        raise ResponseError(InvalidRequestError(
-            detail="repository set identifier is invalid: %s" % repo,
-            pointer=pointer,
-        ))
-    rs, _ = await fetch_reposet(set_id, [RepositorySet.items], uid, db, cache)
-    if rs.owner != account:
-        raise ResponseError(ForbiddenError(
-            detail="User %s is not allowed to reference reposet %d in this query" %
-                   (uid, set_id)))
-    return rs.items
+    rows = await sdb.fetch_all(
+        select([RepositorySet.id, RepositorySet.owner, RepositorySet.items])
+        .where(RepositorySet.id.in_(ids)))
+    reposets = {r[RepositorySet.id.key]: (r[RepositorySet.owner.key], r[RepositorySet.items.key])
+                for r in rows}
+    for set_id in ids:
+        if set_id not in reposets:
+            raise ResponseError(NotFoundError(detail="Repository set %d does not exist" % set_id))
+    return [reposets[set_id] for set_id in ids]
 
 
 async def fetch_reposet(
@@ -7,7 +7,9 @@ import databases.core
 from sqlalchemy import delete, insert, select, update
 
 from athenian.api import FriendlyJson
-from athenian.api.controllers.account import get_installation_id, get_user_account_status
+from athenian.api.cache import bump_cache_namespace
+from athenian.api.controllers.account import gen_account_cache_namespace, get_installation_id, \
+    get_user_account_status
 from athenian.api.controllers.miners.access_classes import access_classes
 from athenian.api.controllers.reposet import fetch_reposet
 from athenian.api.metadata import __package__
@@ -44,6 +46,7 @@ async def create_reposet(request: AthenianWebRequest, body: dict) -> web.Respons
             return e.response
         rs = RepositorySet(owner=account, items=items).create_defaults()
         rid = await sdb_conn.execute(insert(RepositorySet).values(rs.explode()))
+        await bump_cache_namespace(request.cache, gen_account_cache_namespace(account))
         return response(CreatedIdentifier(rid))
 
 
@@ -54,13 +57,14 @@ async def delete_reposet(request: AthenianWebRequest, id: int) -> web.Response:
     :type id: int
     """
     try:
-        _, is_admin = await fetch_reposet(id, [], request.uid, request.sdb, request.cache)
+        rs, is_admin = await fetch_reposet(id, [], request.uid, request.sdb, request.cache)
     except ResponseError as e:
         return e.response
     if not is_admin:
         return ResponseError(ForbiddenError(
             detail="User %s may not modify reposet %d" % (request.uid, id))).response
     await request.sdb.execute(delete(RepositorySet).where(RepositorySet.id == id))
+    await bump_cache_namespace(request.cache, gen_account_cache_namespace(rs.owner))
     return web.Response(status=200)
 
 
@@ -134,6 +138,7 @@ async def update_reposet(request: AthenianWebRequest, id: int, body: List[str])
         await sdb_conn.execute(update(RepositorySet)
                                .where(RepositorySet.id == id)
                                .values(rs.explode()))
+        await bump_cache_namespace(request.cache, gen_account_cache_namespace(rs.owner))
         return web.json_response(body, status=200)
 
 
@@ -3,7 +3,7 @@ import logging
 import os
 from pathlib import Path
 import time
-from typing import Dict, Optional, Union
+from typing import Dict, Optional, Tuple, Union
 
 import databases
 from prometheus_client import CollectorRegistry
@@ -48,6 +48,9 @@ class FakeCache:
             return default
         return value
 
+    async def multi_get(self, *keys: bytes) -> Tuple[Optional[bytes], ...]:
+        return tuple([await self.get(k) for k in keys])
+
     async def set(self, key: bytes, value: Union[bytes, memoryview], exptime: int = 0) -> bool:
         assert isinstance(key, bytes)
         assert isinstance(value, (bytes, memoryview))
@@ -55,6 +58,15 @@ class FakeCache:
         self.mem[key] = value, time.time(), exptime
         return True
 
+    async def add(self, key: bytes, value: bytes, exptime: int = 0) -> bool:
+        if await self.get(key) is not None:
+            return False
+        return await self.set(key, value, exptime)
+
+    async def delete(self, key: bytes) -> bool:
+        assert isinstance(key, bytes)
+        return self.mem.pop(key, None) is not None
+
     async def close(self):
         pass
 
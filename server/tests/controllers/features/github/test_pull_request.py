@@ -1,13 +1,17 @@
 from datetime import datetime, timedelta, timezone
 import itertools
+import pickle
 
 import faker
 import numpy as np
 import pandas as pd
 import pytest
+import scipy.stats
 
-from athenian.api.controllers.features.github.pull_request import mean_confidence_interval, \
-    median_confidence_interval, PullRequestAverageMetricCalculator, \
+from athenian.api.controllers.features.github.pull_request import _binom_interval, \
+    _t_interval, _t_quantiles, mean_confidence_interval, \
+    median_confidence_interval, median_confidence_interval_batch, \
+    PullRequestAverageMetricCalculator, \
     PullRequestMedianMetricCalculator
 from athenian.api.controllers.miners.github.pull_request import Fallback, PullRequestTimes
 
@@ -23,9 +27,9 @@ def test_mean_confidence_interval_positive():
     np.random.seed(8)
     data = np.random.lognormal(1, 2, 1000).astype(np.float32)
     mean, conf_min, conf_max = mean_confidence_interval(data, False)
-    assert isinstance(mean, np.float32)
-    assert isinstance(conf_min, np.float32)
-    assert isinstance(conf_max, np.float32)
+    assert isinstance(mean, float)
+    assert isinstance(conf_min, float)
+    assert isinstance(conf_max, float)
     assert 20.7 < mean < 20.8
     assert 18.93 < conf_min < 18.94
     assert 29.5 < conf_max < 29.6
@@ -33,9 +37,9 @@ def test_mean_confidence_interval_positive():
 
 def test_mean_confidence_interval_negative(square_centered_samples):
     mean, conf_min, conf_max = mean_confidence_interval(square_centered_samples, True)
-    assert isinstance(mean, np.int64)
-    assert isinstance(conf_min, np.int64)
-    assert isinstance(conf_max, np.int64)
+    assert isinstance(mean, int)
+    assert isinstance(conf_min, int)
+    assert isinstance(conf_max, int)
     assert mean == 0
     assert conf_min == -22
     assert conf_max == 22
@@ -72,9 +76,9 @@ def test_mean_confidence_interval_empty():
 
 def test_mean_confidence_interval_negative_list(square_centered_samples):
     mean, conf_min, conf_max = mean_confidence_interval(list(square_centered_samples), True)
-    assert isinstance(mean, np.int64)
-    assert isinstance(conf_min, np.int64)
-    assert isinstance(conf_max, np.int64)
+    assert isinstance(mean, int)
+    assert isinstance(conf_min, int)
+    assert isinstance(conf_max, int)
     assert mean == 0
     assert conf_min == -22
     assert conf_max == 22
@@ -82,9 +86,9 @@ def test_mean_confidence_interval_negative_list(square_centered_samples):
 
 def test_median_confidence_interval_int(square_centered_samples):
     mean, conf_min, conf_max = median_confidence_interval(square_centered_samples)
-    assert isinstance(mean, np.int64)
-    assert isinstance(conf_min, np.int64)
-    assert isinstance(conf_max, np.int64)
+    assert isinstance(mean, int)
+    assert isinstance(conf_min, int)
+    assert isinstance(conf_max, int)
     assert mean == 0
     assert conf_min == -16
     assert conf_max == 16
@@ -106,6 +110,72 @@ def test_median_confidence_interval_empty():
         median_confidence_interval([])
 
 
+@pytest.mark.parametrize("dtype", [int, "timedelta64[s]"])
+def test_median_confidence_interval_batch(dtype):
+    np.random.seed(7)
+    lengths = [0, 1, 2, 0, 7, 100, 101, 0]
+    groups = [np.random.randint(-(10 ** 6), 10 ** 6, n).astype(dtype).astype(
+        "timedelta64[ns]" if dtype != int else int) for n in lengths]
+    result = median_confidence_interval_batch(np.concatenate(groups), np.cumsum(lengths))
+    assert len(result) == len(lengths)
+    for group, r in zip(groups, result):
+        if len(group) == 0:
+            assert r is None
+        else:
+            assert r == median_confidence_interval(group)
+            if dtype == int:
+                assert r[0] == int(np.median(group))
+            else:
+                assert r[0] == pd.Timedelta(np.median(group))
+
+
+def test_median_confidence_interval_even_precision():
+    # float64 cannot represent these values exactly
+    data = np.array([2 ** 60 + 1, 2 ** 60 + 3, 2 ** 62 - 1, 2 ** 62 - 3], dtype="timedelta64[ns]")
+    result = median_confidence_interval_batch(data, np.array([2, 4]))
+    assert result[0][0] == pd.Timedelta(2 ** 60 + 2)
+    assert result[1][0] == pd.Timedelta(2 ** 62 - 2)
+    assert median_confidence_interval(np.array([-3, 0]))[0] == -1
+
+
+@pytest.mark.parametrize("confidence", [0.8, 0.95])
+def test_t_interval_matches_scipy(confidence):
+    for df in (1, 2, 10, 1000):
+        for loc, scale in ((0, 1), (-5.5, 0.1), (100, 30), (1, 0)):
+            np.testing.assert_array_equal(
+                _t_interval(confidence, df, loc, scale),
+                scipy.stats.t.interval(confidence, df, loc=loc, scale=scale))
+
+
+def test_confidence_interval_critical_values_cached(monkeypatch):
+    np.random.seed(8)
+    sizes = np.random.randint(2, 200, 500)
+    groups = [np.random.lognormal(10, 2, n).astype(int) for n in sizes]
+    calls = {"binom": 0, "t": 0}
+
+    def counted(dist, name):
+        interval = dist.interval
+
+        def counted_interval(*args, **kwargs):
+            calls[name] += 1
+            return interval(*args, **kwargs)
+
+        monkeypatch.setattr(dist, "interval", counted_interval)
+
+    counted(scipy.stats.binom, "binom")
+    counted(scipy.stats.t, "t")
+    _binom_interval.cache_clear()
+    _t_quantiles.cache_clear()
+    for _ in range(2):
+        for group in groups:
+            median_confidence_interval(group)
+            mean_confidence_interval(group, False)
+            mean_confidence_interval(group, True)
+        # scipy evaluates the critical values once per distinct number of samples
+        assert calls["binom"] == len(np.unique(sizes))
+        assert calls["t"] == len(np.unique(sizes))
+
+
 @pytest.fixture
 def pr_samples():
     def generate(n):
@@ -203,3 +273,31 @@ def test_pull_request_metric_calculator(pr_samples, cls, negative, dtype):
     assert m.value is None
     assert m.confidence_min is None
     assert m.confidence_max is None
+
+
+class SmallBufferLeadTimeCalculator(PullRequestMedianMetricCalculator):
+    initial_capacity = 4
+
+    def analyze(self, times: PullRequestTimes, min_time: datetime, max_time: datetime,
+                ) -> timedelta:
+        return times.released.value - times.work_began.best
+
+
+def test_pull_request_metric_calculator_buffer_growth_pickle(pr_samples):
+    calc = SmallBufferLeadTimeCalculator()
+    prs = pr_samples(50)
+    for pr in prs:
+        calc(pr, datetime.now(), datetime.now())
+    assert calc.samples.dtype == np.dtype("timedelta64[ns]")
+    assert len(calc.samples) == 50
+    assert len(calc._buffer) == 64
+    assert (calc.samples == np.array(
+        [pd.Timedelta(pr.released.value - pr.work_began.best).to_timedelta64() for pr in prs],
+    )).all()
+    clone = pickle.loads(pickle.dumps(calc))
+    assert len(clone._buffer) == 50
+    assert clone.value() == calc.value()
+    assert isinstance(calc.value().value, pd.Timedelta)
+    calc.reset()
+    assert not calc.value().exists
+    assert len(calc.samples) == 0
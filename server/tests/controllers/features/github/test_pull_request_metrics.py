@@ -11,7 +11,8 @@ from athenian.api.controllers.features.github.pull_request_metrics import Closed
     MergingTimeCalculator, OpenedCalculator, ReleaseCounter, ReleaseTimeCalculator, \
     ReviewCounter, ReviewTimeCalculator, WaitFirstReviewTimeCalculator, WorkInProgressCounter, \
     WorkInProgressTimeCalculator
-from athenian.api.controllers.miners.github.pull_request import Fallback, PullRequestTimes
+from athenian.api.controllers.miners.github.pull_request import Fallback, PullRequestTimes, \
+    PullRequestTimesTable
 from athenian.api.models.web import Granularity
 from tests.controllers.features.github.test_pull_request import ensure_dtype, pr_samples  # noqa
 
@@ -160,3 +161,63 @@ def test_pull_request_metrics_counts(pr_samples, cls):  # noqa: F811
     if cls is not WorkInProgressCounter:
         assert nones > 0
     assert nonones > 0
+
+
+@pytest.mark.parametrize("cls", [
+    WorkInProgressTimeCalculator, ReviewTimeCalculator, MergingTimeCalculator,
+    ReleaseTimeCalculator, LeadTimeCalculator, WaitFirstReviewTimeCalculator,
+    OpenedCalculator, MergedCalculator, ClosedCalculator,
+    WorkInProgressCounter, ReviewCounter, MergingCounter, ReleaseCounter, LeadCounter,
+])
+def test_pull_request_metrics_analyze_batch(pr_samples, cls):  # noqa: F811
+    prs = [random_dropout(pr, 0.3) for pr in pr_samples(1000)]
+    table = PullRequestTimesTable.from_times(prs)
+    time_to = datetime.now(tz=timezone.utc) - timedelta(days=300)
+    time_from = time_to - timedelta(days=365)
+    calc = cls()
+    batch = calc.analyze_batch(table, time_from, time_to)
+    assert len(batch) == len(prs)
+    exists = 0
+    for pr, sample in zip(prs, batch):
+        expected = calc.analyze(pr, time_from, time_to)
+        if expected is None:
+            assert sample is np.ma.masked, str(pr)
+        else:
+            if isinstance(expected, timedelta):
+                sample = pd.Timedelta(sample)
+            assert sample == expected, str(pr)
+            exists += 1
+    assert exists > 0
+
+
+def test_pull_request_flow_ratio_batch(pr_samples):  # noqa: F811
+    prs = pr_samples(1000)
+    time_from = datetime.now(tz=timezone.utc) - timedelta(days=365)
+    time_to = datetime.now(tz=timezone.utc)
+    calc = FlowRatioCalculator()
+    for pr in prs:
+        calc(pr, time_from, time_to)
+    batch_calc = FlowRatioCalculator()
+    batch_calc(PullRequestTimesTable.from_times(prs), time_from, time_to)
+    assert calc.value() == batch_calc.value()
+
+
+def test_pull_request_binned_daily_open_prs(pr_samples):  # noqa: F811
+    prs = pr_samples(1000)
+    # leave every other PR open forever
+    prs = [pr if i % 2 else PullRequestTimes(**{**vars(pr), "closed": Fallback(None, None)})
+           for i, pr in enumerate(prs)]
+    time_to = datetime.now(tz=timezone.utc)
+    time_from = time_to - timedelta(days=365)
+    time_intervals = Granularity.split("day", time_from, time_to)
+    result = BinnedPullRequestMetricCalculator([OpenedCalculator()], time_intervals)(prs)
+    assert len(result) == len(time_intervals) - 1
+    borders = [datetime.combine(d, datetime.min.time(), tzinfo=timezone.utc)
+               for d in time_intervals]
+    for (m,), bin_from, bin_to in zip(result, borders, borders[1:]):
+        expected = sum(1 for pr in prs
+                       if pr.created.best <= bin_to and (
+                           not pr.closed or pr.closed.best > bin_from) and (
+                           OpenedCalculator().analyze(pr, bin_from, bin_to) is not None))
+        assert m.exists
+        assert m.value == expected
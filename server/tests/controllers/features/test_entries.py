@@ -0,0 +1,36 @@
+from datetime import date
+
+from athenian.api.controllers.features.entries import \
+    calc_pull_request_metrics_line_github, calc_pull_request_metrics_line_github_many
+from athenian.api.controllers.features.github.pull_request import calculators
+from athenian.api.controllers.miners.github.pull_request import PullRequestTimesMiner
+from athenian.api.models.web import Granularity
+
+
+async def test_calc_pull_request_metrics_line_github_many(mdb, cache, monkeypatch):
+    mine_many = PullRequestTimesMiner.mine_many.__func__
+    calls = 0
+
+    async def counted_mine_many(cls, *args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return await mine_many(cls, *args, **kwargs)
+
+    monkeypatch.setattr(PullRequestTimesMiner, "mine_many", classmethod(counted_mine_many))
+    monkeypatch.setattr(
+        "athenian.api.controllers.features.entries.PARALLEL_FOR_SETS", 2)
+    metrics = sorted(calculators)
+    time_intervals = Granularity.split("month", date(2016, 1, 1), date(2017, 3, 1))
+    for_sets = [(["src-d/go-git"], []),
+                (["src-d/go-git"], ["mcuadros"]),
+                (["src-d/go-git", "src-d/gitbase"], ["smola", "jfontan"])]
+    for c in (None, cache, cache):
+        results = await calc_pull_request_metrics_line_github_many(
+            metrics, time_intervals, for_sets, mdb, c)
+        assert len(results) == len(for_sets)
+        for result, (repos, devs) in zip(results, for_sets):
+            expected = await calc_pull_request_metrics_line_github(
+                metrics, time_intervals, repos, devs, mdb, None)
+            assert str(result) == str(expected)
+    # the union is mined once per call, the last call hits the cache
+    assert calls == 2
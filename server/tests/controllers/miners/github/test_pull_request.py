@@ -1,15 +1,24 @@
+import asyncio
 from collections import defaultdict
 import dataclasses
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
+import itertools
 from typing import List
 
+import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal, assert_series_equal
+import pytest
+from sqlalchemy import delete, insert
 
-from athenian.api.controllers.miners.github.pull_request import PullRequestListMiner, \
-    PullRequestMiner, PullRequestTimes, PullRequestTimesMiner
+import athenian.api.async_read_sql_query
+from athenian.api.controllers.miners.github.pull_request import _CHILD_MODELS, \
+    _split_months, PullRequestListMiner, PullRequestMiner, PullRequestTimes, \
+    PullRequestTimesMiner
 from athenian.api.controllers.miners.pull_request_list_item import ParticipationKind, \
     PullRequestListItem, Stage
+from athenian.api.models.metadata.github import IssueComment, PullRequest, PullRequestComment, \
+    PullRequestCommit, PullRequestReview
 
 
 async def test_pr_miner_iter(mdb):
@@ -42,7 +51,9 @@ async def test_pr_miner_iter_cache(mdb, cache):
         mdb,
         cache,
     )
-    assert len(cache.mem) == 1
+    # one partition per month
+    assert len(cache.mem) == len(_split_months(date.today() - timedelta(days=10 * 365),
+                                               date.today()))
     first_data = list(miner)
     miner = await PullRequestMiner.mine(
         date.today() - timedelta(days=10 * 365),
@@ -61,6 +72,304 @@ async def test_pr_miner_iter_cache(mdb, cache):
                 assert_frame_equal(fv, sv)
 
 
+@pytest.mark.parametrize("time_from, time_to, months", [
+    (date(2017, 1, 1), date(2017, 2, 1), [date(2017, 1, 1)]),
+    (date(2017, 1, 15), date(2017, 3, 16), [date(2017, 1, 1), date(2017, 2, 1), date(2017, 3, 1)]),
+    (date(2017, 12, 31), date(2018, 1, 2), [date(2017, 12, 1), date(2018, 1, 1)]),
+    (date(2017, 5, 5), date(2017, 5, 5), [date(2017, 5, 1)]),
+])
+def test_split_months(time_from, time_to, months):
+    assert _split_months(time_from, time_to) == months
+
+
+async def test_pr_miner_partitions_shifted_window(mdb, cache):
+    args = [["src-d/go-git"], []]
+    await PullRequestMiner._mine(date(2016, 1, 15), date(2017, 3, 16), *args, mdb, cache)
+    assert len(cache.mem) == 15
+    # everything is in the cache, the DB is not touched
+    shifted = await PullRequestMiner._mine(date(2016, 1, 20), date(2017, 3, 10), *args,
+                                           None, cache)
+    # only the new month is fetched
+    extended = await PullRequestMiner._mine(date(2016, 1, 20), date(2017, 4, 10), *args,
+                                            mdb, cache)
+    assert len(cache.mem) == 16
+    for cached_dfs, (time_from, time_to) in ((shifted, (date(2016, 1, 20), date(2017, 3, 10))),
+                                             (extended, (date(2016, 1, 20), date(2017, 4, 10)))):
+        fresh_dfs = await PullRequestMiner._mine(time_from, time_to, *args, mdb, None)
+        assert len(fresh_dfs[0]) > 0
+        models = (PullRequest, PullRequestReview, PullRequestComment, IssueComment,
+                  PullRequestCommit)
+        for cached_df, fresh_df, model in zip(cached_dfs, fresh_dfs, models):
+            cols = [c.name for c in model.__table__.primary_key.columns]
+            assert_frame_equal(cached_df.sort_values(cols).reset_index(drop=True),
+                               fresh_df.sort_values(cols).reset_index(drop=True))
+
+
+async def test_pr_miner_partitions_shared_by_developers(mdb, cache):
+    time_from, time_to = date(2016, 1, 15), date(2017, 3, 16)
+    name = "athenian.api.controllers.miners.github.pull_request.PullRequestMiner._mine_partition"
+    await PullRequestMiner._mine(time_from, time_to, ["src-d/go-git"], [], mdb, cache)
+    assert len(cache.mem) == 15
+    for developers in (["mcuadros"], ["smola", "jfontan"], ["mcuadros", "smola"]):
+        # the DB is not touched
+        dfs = await PullRequestMiner._mine(
+            time_from, time_to, ["src-d/go-git"], developers, None, cache)
+        fresh_dfs = await PullRequestMiner._mine(
+            time_from, time_to, ["src-d/go-git"], developers, mdb, None)
+        assert len(dfs[0]) > 0
+        assert set(dfs[0][PullRequest.user_login.key]) <= set(developers)
+        for df, fresh_df in zip(dfs, fresh_dfs):
+            assert len(df) == len(fresh_df)
+    assert len(cache.mem) == 15
+    hits = cache.metrics["hits"].labels("athenian.api", name)._value.get()
+    misses = cache.metrics["misses"].labels("athenian.api", name)._value.get()
+    assert hits == 3 * 15
+    assert misses == 15
+
+
+@pytest.mark.parametrize("with_cache", [False, True])
+async def test_pr_miner_mine_many(mdb, cache, with_cache):
+    cache = cache if with_cache else None
+    time_from, time_to = date(2016, 1, 15), date(2017, 3, 16)
+    filters = [(["src-d/go-git"], []),
+               (["src-d/go-git"], ["mcuadros"]),
+               (["src-d/go-git", "src-d/gitbase"], ["smola", "jfontan"]),
+               (["src-d/gitbase"], [])]
+    miners = await PullRequestTimesMiner.mine_many(time_from, time_to, filters, mdb, cache)
+    assert len(miners) == len(filters)
+    for miner, (repos, devs) in zip(miners, filters):
+        assert isinstance(miner, PullRequestTimesMiner)
+        fresh = await PullRequestTimesMiner.mine(time_from, time_to, repos, devs, mdb, None)
+        assert _times_values(miner) == _times_values(fresh)
+    assert len(list(miners[0])) > len(list(miners[1])) > 0
+    assert len(list(miners[3])) == 0
+
+
+def _times_values(miner: PullRequestTimesMiner) -> List[str]:
+    return sorted(str([(getattr(t, f).value, getattr(t, f).best)
+                       for f in PullRequestTimes.__dataclass_fields__])
+                  for t in miner)
+
+
+async def test_pr_miner_cache_serialization(mdb):
+    dfs = await PullRequestMiner._mine(
+        date(2016, 1, 1), date(2019, 1, 1), ["src-d/go-git"], [], mdb, None)
+    sizes = {}
+    for compression in (None, "lz4", "zstd"):
+        buffer = PullRequestMiner._serialize_for_cache(dfs, compression)
+        sizes[compression] = len(buffer)
+        for df, cached_df in zip(dfs, PullRequestMiner._deserialize_from_cache(bytes(buffer))):
+            assert_frame_equal(df, cached_df)
+    assert sizes["lz4"] < sizes[None]
+    assert sizes["zstd"] < sizes[None]
+    empty_dfs = PullRequestMiner._deserialize_from_cache(
+        PullRequestMiner._serialize_for_cache([df.iloc[:0] for df in dfs], "lz4"))
+    assert [list(df.columns) for df in empty_dfs] == [list(df.columns) for df in dfs]
+    assert all(len(df) == 0 for df in empty_dfs)
+
+
+async def test_pr_miner_cache_serialization_metrics(mdb, cache):
+    name = "athenian.api.controllers.miners.github.pull_request.PullRequestMiner._mine_partition"
+    args = date(2016, 1, 1), date(2016, 3, 1), ["src-d/go-git"], []
+    await PullRequestMiner._mine(*args, mdb, cache)
+    await PullRequestMiner._mine(*args, mdb, cache)
+    for metric in ("payload_size", "serialization_time", "deserialization_time"):
+        histogram = cache.metrics[metric].labels("athenian.api", name)
+        assert sum(b.get() for b in histogram._buckets) == 2
+    assert cache.metrics["payload_size"].labels("athenian.api", name)._sum.get() == \
+        sum(len(v[0]) for v in cache.mem.values())
+
+
+@pytest.mark.parametrize("warm_time_to", [None, date(2017, 2, 1)])
+async def test_pr_miner_partitions_late_children(mdb, cache, warm_time_to):
+    # PR #200 was closed on 2017-01-12, so it belongs only to the January partition
+    comment_id = 10 ** 12
+    await mdb.execute(insert(IssueComment).values({
+        IssueComment.id: comment_id,
+        IssueComment.delivery_id: "test",
+        IssueComment.created_at: datetime(2017, 2, 10),
+        IssueComment.updated_at: datetime(2017, 2, 10),
+        IssueComment.user_id: 1,
+        IssueComment.user_login: "test",
+        IssueComment.repository_name: "go-git",
+        IssueComment.repository_owner: "src-d",
+        IssueComment.repository_fullname: "src-d/go-git",
+        IssueComment.issue_number: 200,
+    }))
+    try:
+        args = date(2017, 1, 1), date(2017, 3, 1), ["src-d/go-git"], []
+        if warm_time_to is not None:
+            # the January partition is stored by a shorter request
+            await PullRequestMiner._mine(args[0], warm_time_to, *args[2:], mdb, cache)
+        expected = await PullRequestMiner._mine(*args, mdb, None)
+        assert comment_id in expected[3][IssueComment.id.key].values
+        for _ in range(2):
+            dfs = await PullRequestMiner._mine(*args, mdb, cache)
+            for df, expected_df, model in zip(dfs, expected, (PullRequest,) + _CHILD_MODELS):
+                cols = [c.name for c in model.__table__.primary_key.columns]
+                assert_frame_equal(df.sort_values(cols).reset_index(drop=True),
+                                   expected_df.sort_values(cols).reset_index(drop=True))
+    finally:
+        await mdb.execute(delete(IssueComment).where(IssueComment.id == comment_id))
+
+
+@pytest.mark.parametrize("parallel", [1, 2, 4])
+async def test_pr_miner_parallel_child_queries(mdb, monkeypatch, parallel):
+    read_filtered_models = PullRequestMiner._read_filtered_models
+    connections = []
+    in_flight = max_in_flight = 0
+
+    async def traced_read_filtered_models(conn, *args):
+        nonlocal in_flight, max_in_flight
+        # keep the objects alive so that their ids are not reused
+        connections.append(conn)
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.1)
+        try:
+            return await read_filtered_models(conn, *args)
+        finally:
+            in_flight -= 1
+
+    args = date(2016, 1, 1), date(2019, 1, 1), ["src-d/go-git"], [], mdb, None
+    monkeypatch.setattr(PullRequestMiner, "PARALLEL_QUERIES", 1)
+    expected = await PullRequestMiner._mine(*args)
+    monkeypatch.setattr(PullRequestMiner, "PARALLEL_QUERIES", parallel)
+    monkeypatch.setattr(PullRequestMiner, "_read_filtered_models",
+                        staticmethod(traced_read_filtered_models))
+    # the caller's connection must not be shared by the child queries
+    async with mdb.connection():
+        dfs = await PullRequestMiner._mine(*args)
+    assert max_in_flight == parallel
+    assert len({id(c) for c in connections}) == (1 if parallel == 1 else 4)
+    for df, expected_df in zip(dfs, expected):
+        assert_frame_equal(df, expected_df)
+
+
+async def test_pr_miner_child_rows_subquery(mdb, monkeypatch):
+    args = date(2016, 1, 1), date(2019, 1, 1), ["src-d/go-git", "src-d/gitbase"], [], mdb
+    in_list_dfs = await PullRequestMiner._fetch(*args)
+    monkeypatch.setattr(PullRequestMiner, "MAX_IN_LIST_PRS", 0)
+    # the child rows arrive in several chunks
+    monkeypatch.setattr(athenian.api.async_read_sql_query, "CHUNK_SIZE", 100)
+    subquery_dfs = await PullRequestMiner._fetch(*args)
+    assert_frame_equal(in_list_dfs[0], subquery_dfs[0])
+    prs = subquery_dfs[0]
+    keys = set(zip(prs[PullRequest.repository_fullname.key], prs[PullRequest.number.key]))
+    models = (PullRequestReview, PullRequestComment, IssueComment, PullRequestCommit)
+    for in_list_df, subquery_df, model in zip(in_list_dfs[1:], subquery_dfs[1:], models):
+        assert len(subquery_df) > 0
+        subquery_keys = list(zip(subquery_df[model.repository_fullname.key],
+                                 subquery_df[model.pull_request_number.key]))
+        # exactly the rows of the mined PRs
+        assert set(subquery_keys) <= keys
+        in_list_df = in_list_df[[k in keys for k in zip(
+            in_list_df[model.repository_fullname.key],
+            in_list_df[model.pull_request_number.key])]]
+        cols = [c.name for c in model.__table__.primary_key.columns]
+        assert_frame_equal(in_list_df.sort_values(cols).reset_index(drop=True),
+                           subquery_df.sort_values(cols).reset_index(drop=True))
+
+
+@pytest.mark.parametrize("cls", [PullRequestTimesMiner, PullRequestListMiner])
+async def test_pr_miner_column_projection(mdb, cache, cls):
+    args = date(2016, 1, 1), date(2019, 1, 1), ["src-d/go-git"], []
+    full_dfs = await PullRequestMiner._mine(*args, mdb, None)
+    for dfs in (await cls._mine(*args, mdb, None), await cls._mine(*args, mdb, cache)):
+        for df, full_df, model in zip(dfs, full_dfs, (PullRequest,) + _CHILD_MODELS):
+            columns = set(df.columns)
+            assert columns == {c.name for c in cls._columns(model)}
+            assert columns < set(full_df.columns)
+            assert len(df) == len(full_df)
+    assert PullRequest.body.key not in dfs[0].columns
+    assert PullRequestCommit.message.key not in dfs[-1].columns
+
+
+async def test_pr_miner_shared_partitions(mdb, cache):
+    for model, columns in PullRequestTimesMiner.COLUMNS.items():
+        assert columns <= PullRequestTimesMiner.PARTITION_COLUMNS[model]
+    args = date(2016, 1, 1), date(2016, 6, 1), ["src-d/go-git"], []
+    await PullRequestListMiner._mine(*args, mdb, cache)
+    size = len(cache.mem)
+    dfs = await PullRequestTimesMiner._mine(*args, mdb, cache)
+    # the times miner reads the partitions stored by the list miner
+    assert len(cache.mem) == size
+    name = "athenian.api.controllers.miners.github.pull_request.PullRequestTimesMiner." \
+           "_mine_partition"
+    assert cache.metrics["misses"].labels("athenian.api", name)._value.get() == 0
+    expected = await PullRequestTimesMiner._mine(*args, mdb, None)
+    pr_cols = [PullRequest.repository_fullname.key, PullRequest.number.key]
+    for df, expected_df, model in zip(dfs, expected, (PullRequest,) + _CHILD_MODELS):
+        cols = pr_cols if model is PullRequest else \
+            [c.name for c in model.__table__.primary_key.columns]
+        assert_frame_equal(df.sort_values(cols).reset_index(drop=True),
+                           expected_df.sort_values(cols).reset_index(drop=True))
+
+
+def _synthetic_miner(n: int) -> PullRequestMiner:
+    np.random.seed(7)
+    repos = np.array(["src-d/go-git", "src-d/hercules", "athenianco/api"], dtype=object)
+    prs = pd.DataFrame({
+        PullRequest.repository_fullname.key: repos[np.arange(n) % len(repos)],
+        PullRequest.number.key: np.arange(n) // len(repos),
+    })
+
+    def children(model):
+        pr_indexes = np.random.randint(0, n, 3 * n)
+        return pd.DataFrame({
+            model.repository_fullname.key: prs[PullRequest.repository_fullname.key].values[
+                pr_indexes],
+            model.pull_request_number.key: prs[PullRequest.number.key].values[pr_indexes],
+            "payload": np.arange(len(pr_indexes)),
+        })
+
+    return PullRequestMiner(prs, children(PullRequestReview), children(PullRequestComment),
+                            children(IssueComment), children(PullRequestCommit))
+
+
+def test_pr_miner_iter_synthetic_matches_masks():
+    miner = _synthetic_miner(300)
+    for i, pr in enumerate(miner):
+        if i % 10 != 0:
+            continue
+        for k, model in (("reviews", PullRequestReview),
+                         ("review_comments", PullRequestComment),
+                         ("comments", IssueComment),
+                         ("commits", PullRequestCommit)):
+            df = getattr(miner, "_" + k).sort_values("payload")
+            expected = df[
+                (df[model.pull_request_number.key] == pr.pr[PullRequest.number.key]) &  # noqa
+                (df[model.repository_fullname.key] == pr.pr[PullRequest.repository_fullname.key])]
+            assert_frame_equal(getattr(pr, k).reset_index(drop=True),
+                               expected.reset_index(drop=True))
+
+
+def test_pr_miner_iter_no_masks(monkeypatch):
+    miner = _synthetic_miner(5_000)
+    for k in ("reviews", "review_comments", "comments", "commits"):
+        # the rows of each PR are one contiguous range and the ranges cover the whole frame
+        ranges = sorted(getattr(miner, "_%s_index" % k).values())
+        assert ranges[0][0] == 0
+        assert ranges[-1][1] == len(getattr(miner, "_" + k))
+        assert all(prev[1] == cur[0] for prev, cur in zip(ranges, ranges[1:]))
+    masks = 0
+    getitem = pd.DataFrame.__getitem__
+
+    def counted_getitem(self, key):
+        nonlocal masks
+        if getattr(key, "dtype", None) == bool:
+            masks += 1
+        return getitem(self, key)
+
+    monkeypatch.setattr(pd.DataFrame, "__getitem__", counted_getitem)
+    # the cost of yielding a single PR must not depend on the overall number of PRs,
+    # so we must not scan the child frames with boolean masks
+    size = sum(len(pr.reviews) + len(pr.review_comments) + len(pr.comments) + len(pr.commits)
+               for pr in itertools.islice(miner, 1000))
+    assert size > 0
+    assert masks == 0
+
+
 def validate_pull_request_times(prt: PullRequestTimes):
     for k, v in vars(prt).items():
         if not v:
@@ -97,6 +406,32 @@ async def test_pr_times_miner(mdb):
         validate_pull_request_times(prt)
 
 
+@pytest.mark.parametrize("emptied", [None, "_review_comments", "_commits", "_reviews"])
+async def test_pr_times_miner_table_matches_compile(mdb, emptied):
+    miner = await PullRequestTimesMiner.mine(
+        date.today() - timedelta(days=10 * 365),
+        date.today(),
+        ["src-d/go-git"],
+        [],
+        mdb,
+        None,
+    )
+    if emptied is not None:
+        setattr(miner, emptied, getattr(miner, emptied).iloc[0:0])
+    prts = list(miner)
+    expected = [miner._compile(pr) for pr in PullRequestMiner.__iter__(miner)]
+    assert len(prts) == len(expected) > 0
+    for prt, exp in zip(prts, expected):
+        for field in PullRequestTimes.__dataclass_fields__:
+            assert getattr(prt, field).value == getattr(exp, field).value, field
+            assert getattr(prt, field).best == getattr(exp, field).best, field
+        assert prt.work_began.best == exp.work_began.best
+    table = miner.to_table()
+    assert len(table) == len(prts)
+    assert (table.best.dtypes == "datetime64[ns, UTC]").all()
+    assert (table.has_value.dtypes == bool).all()
+
+
 async def test_pr_times_miner_empty_review_comments(mdb):
     miner = await PullRequestTimesMiner.mine(
         date.today() - timedelta(days=10 * 365),
@@ -1,7 +1,8 @@
 import pytest
 
 from athenian.api import ResponseError
-from athenian.api.controllers.account import get_installation_id
+from athenian.api.controllers.account import ACCOUNT_STATUS_CACHE_TTL, get_installation_id, \
+    get_user_account_status, get_user_account_statuses
 
 
 async def test_get_installation_id_cache(sdb, cache):
@@ -24,3 +25,30 @@ async def test_get_installation_id_no_cache(sdb):
 async def test_get_installation_id_error(sdb):
     with pytest.raises(ResponseError):
         await get_installation_id(2, sdb, None)
+
+
+async def test_get_user_account_statuses_cache(sdb, cache):
+    user = "auth0|5e1f6dfb57bc640ea390557b"
+    assert await get_user_account_statuses(user, [1, 2, 1], sdb, cache) == [True, False, True]
+    # plus the namespace versions
+    assert len(cache.mem) == 4
+    assert await get_user_account_statuses(user, [2], sdb, None) == [False]
+    # use the cache
+    assert await get_user_account_statuses(user, [2, 1], sdb, cache) == [False, True]
+    assert len(cache.mem) == 4
+
+
+async def test_get_user_account_statuses_error(sdb, cache):
+    with pytest.raises(ResponseError):
+        await get_user_account_statuses("auth0|5e1f6dfb57bc640ea390557b", [1, 3], sdb, cache)
+    # only the namespace versions
+    assert len(cache.mem) == 2
+
+
+async def test_get_user_account_status_cache_ttl(sdb, cache):
+    user = "auth0|5e1f6dfb57bc640ea390557b"
+    assert await get_user_account_status(user, 1, sdb, cache)
+    assert await get_user_account_statuses(user, [2], sdb, cache) == [False]
+    # the namespace versions never expire, the statuses expire soon
+    assert sorted(exp for _, _, exp in cache.mem.values()) == \
+        [0, 0, ACCOUNT_STATUS_CACHE_TTL, ACCOUNT_STATUS_CACHE_TTL]
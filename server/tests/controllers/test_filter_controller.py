@@ -1,13 +1,16 @@
 from collections import defaultdict
+from datetime import datetime
 import json
 from typing import Set
 
 from aiohttp import ClientResponse
 from prometheus_client import CollectorRegistry
 import pytest
+from sqlalchemy import and_, select, update
 
 from athenian.api import setup_cache_metrics
 from athenian.api.controllers.miners.pull_request_list_item import Stage
+from athenian.api.models.metadata.github import PullRequest
 from athenian.api.models.web.pull_request_participant import PullRequestParticipant
 from athenian.api.models.web.pull_request_pipeline_stage import PullRequestPipelineStage
 from tests.conftest import FakeCache
@@ -296,3 +299,71 @@ async def test_filter_prs_david_bug(client, headers):
     response = await client.request(
         method="POST", path="/v1/filter/pull_requests", headers=headers, json=body)
     assert response.status == 200
+
+
+async def test_filter_prs_etag(client, headers, app, cache):
+    app._cache = cache
+    body = {
+        "date_from": "2015-10-13",
+        "date_to": "2020-01-23",
+        "account": 1,
+        "stages": ["wip", "review"],
+    }
+    response = await client.request(
+        method="POST", path="/v1/filter/pull_requests", headers=headers, json=body)
+    assert response.status == 200
+    etag = response.headers["ETag"]
+    assert etag.startswith('"') and etag.endswith('"')
+    data = await response.read()
+    response = await client.request(
+        method="POST", path="/v1/filter/pull_requests", headers=dict(headers, **{
+            "If-None-Match": 'W/"xxx", %s' % etag}), json=body)
+    assert response.status == 304
+    assert response.headers["ETag"] == etag
+    # the response is in memcached
+    response = await client.request(
+        method="POST", path="/v1/filter/pull_requests", headers=headers, json=body)
+    assert response.status == 200
+    assert response.headers["ETag"] == etag
+    assert await response.read() == data
+    name = "athenian.api.controllers.filter_controller.filter_prs"
+    assert cache.metrics["hits"].labels("athenian.api", name)._value.get() == 1
+    assert cache.metrics["misses"].labels("athenian.api", name)._value.get() == 1
+    body["stages"] = ["wip"]
+    response = await client.request(
+        method="POST", path="/v1/filter/pull_requests", headers=dict(headers, **{
+            "If-None-Match": etag}), json=body)
+    assert response.status == 200
+    assert response.headers["ETag"] != etag
+
+
+async def test_filter_prs_etag_data_change(client, headers, app, cache, mdb):
+    app._cache = cache
+    body = {
+        "date_from": "2015-10-13",
+        "date_to": "2020-01-23",
+        "account": 1,
+        "stages": ["wip", "review"],
+    }
+
+    async def filter_pr_1254():
+        response = await client.request(
+            method="POST", path="/v1/filter/pull_requests", headers=headers, json=body)
+        assert response.status == 200
+        prs = json.loads((await response.read()).decode("utf-8"))["data"]
+        pr, = [pr for pr in prs if pr["number"] == 1254]
+        return response.headers["ETag"], pr
+
+    etag, pr = await filter_pr_1254()
+    where = and_(PullRequest.repository_fullname == "src-d/go-git", PullRequest.number == 1254)
+    updated_at = await mdb.fetch_val(select([PullRequest.updated_at]).where(where))
+    await mdb.execute(update(PullRequest).where(where).values({
+        PullRequest.updated_at: datetime(2020, 1, 10)}))
+    try:
+        new_etag, new_pr = await filter_pr_1254()
+    finally:
+        await mdb.execute(update(PullRequest).where(where).values({
+            PullRequest.updated_at: updated_at}))
+    assert new_etag != etag
+    assert new_pr["updated"] != pr["updated"]
+    assert new_pr["updated"].startswith("2020-01-10")
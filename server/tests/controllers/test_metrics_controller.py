@@ -307,3 +307,45 @@ async def test_calc_metrics_prs_index_error(client, headers):
         method="POST", path="/v1/metrics/prs", headers=headers, json=body,
     )
     assert response.status == 200
+
+
+async def test_calc_metrics_prs_etag(client, headers, app, cache):
+    app._cache = cache
+    body = {
+        "for": [
+            {
+                "developers": ["github.com/vmarkovtsev", "github.com/mcuadros"],
+                "repositories": ["{1}"],
+            },
+        ],
+        "metrics": [MetricID.PR_LEAD_TIME],
+        "date_from": "2015-10-13",
+        "date_to": "2020-01-23",
+        "granularity": "month",
+        "account": 1,
+    }
+    response = await client.request(
+        method="POST", path="/v1/metrics/prs", headers=headers, json=body,
+    )
+    assert response.status == 200
+    etag = response.headers["ETag"]
+    data = await response.read()
+    response = await client.request(
+        method="POST", path="/v1/metrics/prs", headers=dict(headers, **{"If-None-Match": etag}),
+        json=body,
+    )
+    assert response.status == 304
+    assert await response.read() == b""
+    response = await client.request(
+        method="POST", path="/v1/metrics/prs", headers=headers, json=body,
+    )
+    assert response.status == 200
+    assert response.headers["ETag"] == etag
+    assert await response.read() == data
+    body["granularity"] = "week"
+    response = await client.request(
+        method="POST", path="/v1/metrics/prs", headers=dict(headers, **{"If-None-Match": etag}),
+        json=body,
+    )
+    assert response.status == 200
+    assert response.headers["ETag"] != etag
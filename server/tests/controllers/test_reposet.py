@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy import delete
+
+from athenian.api import ResponseError
+from athenian.api.cache import bump_cache_namespace
+from athenian.api.controllers.account import gen_account_cache_namespace
+from athenian.api.controllers.reposet import resolve_reposets
+from athenian.api.models.state.models import RepositorySet
+
+
+async def test_resolve_reposets_cache(sdb, cache):
+    user = "auth0|5e1f6dfb57bc640ea390557b"
+    repos = ["{1}", "github.com/src-d/hercules", "{1}"]
+    pointers = [".in[%d]" % i for i in range(len(repos))]
+    resolved = [["github.com/src-d/go-git", "github.com/src-d/gitbase"],
+                ["github.com/src-d/hercules"],
+                ["github.com/src-d/go-git", "github.com/src-d/gitbase"]]
+    assert await resolve_reposets(repos, pointers, user, 1, sdb, cache) == resolved
+    # the reposet, the account status and the account namespace version
+    assert len(cache.mem) == 3
+    assert await resolve_reposets(repos, pointers, user, 1, sdb, cache) == resolved
+    assert len(cache.mem) == 3
+    assert await resolve_reposets(repos, pointers, user, 1, sdb, None) == resolved
+
+
+async def test_resolve_reposets_invalidation(sdb, cache):
+    user = "auth0|5e1f6dfb57bc640ea390557b"
+    items = ["github.com/src-d/go-git", "github.com/src-d/gitbase"]
+    assert await resolve_reposets(["{1}"], [".in[0]"], user, 1, sdb, cache) == [items]
+    await sdb.execute(delete(RepositorySet).where(RepositorySet.id == 1))
+    assert await resolve_reposets(["{1}"], [".in[0]"], user, 1, sdb, cache) == [items]
+    await bump_cache_namespace(cache, gen_account_cache_namespace(1))
+    with pytest.raises(ResponseError) as e:
+        await resolve_reposets(["{1}"], [".in[0]"], user, 1, sdb, cache)
+    assert e.value.response.status == 404
+
+
+@pytest.mark.parametrize("repos,account,status", [
+    (["{1"], 1, 400),
+    (["{x}"], 1, 400),
+    (["{1}", "{10}"], 1, 404),
+    (["{3}"], 3, 404),
+    (["{1}", "{2}"], 1, 403),
+])
+async def test_resolve_reposets_errors(sdb, cache, repos, account, status):
+    with pytest.raises(ResponseError) as e:
+        await resolve_reposets(repos, [".in[%d]" % i for i in range(len(repos))],
+                               "auth0|5e1f6dfb57bc640ea390557b", account, sdb, cache)
+    assert e.value.response.status == status
@@ -0,0 +1,156 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import math
+
+from databases.backends.postgres import PostgresBackend, Record
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+import pytest
+from sqlalchemy import ARRAY, BigInteger, Boolean, select, Text, TIMESTAMP
+
+import athenian.api.async_read_sql_query
+from athenian.api.async_read_sql_query import _assemble_frame, _decode_in_chunks, \
+    _decode_records, _finalize_frame, _record_values, _records_to_frame, _resolve_columns, \
+    _to_utc_datetimes, read_sql_query, read_sql_query_chunked
+from athenian.api.models.metadata.github import PullRequest
+
+
+names = ["id", "repo", "created_at", "closed_at", "merged", "additions", "labels"]
+types = [BigInteger(), Text(), TIMESTAMP(timezone=True), TIMESTAMP(timezone=True), Boolean(),
+         BigInteger(), ARRAY(Text())]
+
+
+def _generate_rows(n: int, tz=timezone.utc, labels: bool = True):
+    base = datetime(2020, 1, 1, tzinfo=tz)
+    sentinel = datetime(1, 1, 1, tzinfo=timezone.utc)
+    return [(i, "src-d/go-git%d" % (i % 10), base + timedelta(seconds=i),
+             sentinel if i % 3 == 0 else (None if i % 3 == 1 else base),
+             i % 2 == 0, None if i % 5 == 0 else i, ["bug"] if labels else None)
+            for i in range(n)]
+
+
+def test_decode_records():
+    rows = _generate_rows(20)
+    chunks = [[] for _ in names]
+    for i in range(0, len(rows), 7):
+        for column, chunk in zip(chunks, _decode_records(rows[i:i + 7], types)):
+            column.append(chunk)
+    df = _assemble_frame(chunks, names, types)
+    assert len(df) == len(rows)
+    assert df["id"].dtype == np.int64
+    assert df["repo"].dtype == object
+    assert df["merged"].dtype == bool
+    assert df["additions"].dtype == float
+    assert df["additions"].isnull().sum() == 4
+    for col in ("created_at", "closed_at"):
+        assert str(df[col].dtype) == "datetime64[ns, UTC]"
+    assert df["created_at"].notnull().all()
+    # both NULL and the 0001-01-01 sentinel become NaT
+    assert df["closed_at"].isnull().sum() == 14
+    assert df["closed_at"].iloc[2] == pd.Timestamp("2020-01-01", tz=timezone.utc)
+    assert df["labels"].iloc[0] == ["bug"]
+
+
+def test_decode_records_empty():
+    df = _assemble_frame([[] for _ in names], names, types)
+    assert len(df) == 0
+    assert list(df.columns) == names
+    assert str(df["created_at"].dtype) == "datetime64[ns, UTC]"
+
+
+async def test_read_sql_query_model(mdb):
+    df = await read_sql_query(PullRequest.__table__.select(), mdb, PullRequest)
+    assert len(df) > 0
+    assert list(df.columns) == [c.name for c in PullRequest.__table__.columns]
+    assert str(df[PullRequest.created_at.key].dtype) == "datetime64[ns, UTC]"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 50, 1000000])
+async def test_read_sql_query_chunked(mdb, chunk_size):
+    query = select([PullRequest]).where(PullRequest.repository_fullname == "src-d/go-git") \
+        .order_by(PullRequest.node_id)
+    df = await read_sql_query(query, mdb, PullRequest)
+    async with read_sql_query_chunked(query, mdb, PullRequest, chunk_size) as it:
+        chunks = [c async for c in it]
+    assert all(0 < len(c) <= chunk_size for c in chunks)
+    assert len(chunks) == math.ceil(len(df) / chunk_size)
+    assert_frame_equal(pd.concat(chunks, ignore_index=True), df, check_dtype=False)
+
+
+async def test_read_sql_query_chunked_empty(mdb):
+    query = select([PullRequest]).where(PullRequest.repository_fullname == "xxx")
+    async with read_sql_query_chunked(query, mdb, PullRequest) as it:
+        chunks = [c async for c in it]
+    assert len(chunks) == 1
+    assert_frame_equal(chunks[0], await read_sql_query(query, mdb, PullRequest))
+
+
+async def test_read_sql_query_chunked_early_exit(mdb):
+    query = select([PullRequest]).where(PullRequest.repository_fullname == "src-d/go-git")
+    async with mdb.connection() as conn:
+        async with read_sql_query_chunked(query, conn, PullRequest, 1) as it:
+            async for chunk in it:
+                assert len(chunk) == 1
+                break
+        # the connection must be free again
+        df = await asyncio.wait_for(read_sql_query(query, conn, PullRequest), 10)
+    assert len(df) > 1
+
+
+def test_decode_records_databases(monkeypatch):
+    monkeypatch.setattr(athenian.api.async_read_sql_query, "CHUNK_SIZE", 7)
+    rows = _generate_rows(100, labels=False)
+    dialect = PostgresBackend("postgresql://localhost/db")._dialect
+    result_columns = tuple((n, None, (n,), t) for n, t in zip(names, types))
+
+    class Row(tuple):
+        def keys(self):
+            return names
+
+    # this is what databases.Database.fetch_all() returns on PostgreSQL
+    records = [Record(Row(r), result_columns, dialect) for r in rows]
+    assert _record_values(records) == rows
+    expected = _records_to_frame(records, names, types)
+    assert expected["closed_at"].isnull().sum() == 67
+    assert_frame_equal(_decode_in_chunks(records, names, types), expected)
+
+
+def test_decode_in_chunks_upcast(monkeypatch):
+    monkeypatch.setattr(athenian.api.async_read_sql_query, "CHUNK_SIZE", 2)
+    records = [{"a": 1, "b": True}, {"a": 2, "b": False}, {"a": None, "b": None}]
+    df = _decode_in_chunks(records, ["a", "b"], [BigInteger(), Boolean()])
+    assert df["a"].dtype == float
+    assert df["a"].tolist()[:2] == [1, 2]
+    assert math.isnan(df["a"].iloc[2])
+    assert df["b"].tolist() == [True, False, None]
+
+
+async def test_finalize_frame_types(mdb):
+    records = await mdb.fetch_all(select([PullRequest]))
+    names, types = _resolve_columns(PullRequest)
+    sentinel = datetime(1, 1, 1, tzinfo=timezone.utc)
+    closed_at = names.index(PullRequest.closed_at.key)
+    rows = []
+    for r in records:
+        r = list(r)
+        if r[closed_at] is None:
+            r[closed_at] = sentinel
+        rows.append(r)
+    df = pd.DataFrame.from_records(rows, columns=names, coerce_float=True)
+    # scanning every cell must give the same result as converting only the timestamp columns
+    before_df = _finalize_frame(df.copy(), None)
+    after_df = _finalize_frame(df.copy(), types)
+    assert after_df[PullRequest.closed_at.key].isnull().sum() == \
+        before_df[PullRequest.closed_at.key].isnull().sum()
+    assert_frame_equal(before_df.drop(columns=PullRequest.closed_at.key),
+                       after_df.drop(columns=PullRequest.closed_at.key))
+
+
+def test_to_utc_datetimes():
+    values = [datetime(2020, 1, 1, 3, tzinfo=timezone(timedelta(hours=3))),
+              datetime(1, 1, 1, tzinfo=timezone.utc), datetime(1, 1, 1), None]
+    result = _to_utc_datetimes(values)
+    assert str(result.dtype) == "datetime64[ns, UTC]"
+    assert result[0] == pd.Timestamp("2020-01-01", tz=timezone.utc)
+    assert result[1:].isnull().all()
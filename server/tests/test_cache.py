@@ -1,7 +1,15 @@
+import asyncio
+import inspect
+import pickle
+import time
+from typing import List
+
 import aiomcache
 import pytest
 
-from athenian.api.cache import _gen_cache_key
+import athenian.api.cache
+from athenian.api.cache import _gen_binder, _gen_lease_key, bump_cache_namespace, cached, \
+    cached_batch, gen_cache_key, get_chunked, set_chunked
 
 
 @pytest.mark.parametrize("fmt,args", [("text", []),
@@ -11,17 +19,437 @@ from athenian.api.cache import _gen_cache_key
                                       ("xxx %s %d yyy", ["y", 2]),
                                       ("x" * 100500, [])])
 def test_gen_cache_key_formats(fmt, args):
-    key = _gen_cache_key(fmt, *args)
+    key = gen_cache_key(fmt, *args)
     assert key
     aiomcache.Client._validate_key(aiomcache.Client, key)
     for _ in range(100):
         # check that there is no randomness
-        assert key == _gen_cache_key(fmt, *args)
+        assert key == gen_cache_key(fmt, *args)
 
 
 def test_gen_cache_key_distinct():
-    key1 = _gen_cache_key("a" * 10000)
-    key2 = _gen_cache_key("a" * 9999 + "b")
+    key1 = gen_cache_key("a" * 10000)
+    key2 = gen_cache_key("a" * 9999 + "b")
     assert key1 != key2
-    key2 = _gen_cache_key("b" + "a" * 9999)
+    key2 = gen_cache_key("b" + "a" * 9999)
     assert key1 != key2
+
+
+def _bound(a, b, c=3, d=None):
+    pass
+
+
+def _bound_var(a, *args, b=2, **kwargs):
+    pass
+
+
+@pytest.mark.parametrize("func,args,kwargs", [
+    (_bound, (1, 2), {}),
+    (_bound, (1, 2, 4, 5), {}),
+    (_bound, (1,), {"b": 2, "d": 5}),
+    (_bound, (), {"d": 5, "a": 1, "b": 2}),
+    (_bound_var, (1, 2, 3), {"b": 4, "x": 5}),
+    (_bound_var, (), {"a": 1}),
+])
+def test_gen_binder(func, args, kwargs):
+    arguments = _gen_binder(func)(args, kwargs)
+    assert arguments == inspect.signature(func).bind(*args, **kwargs).arguments
+
+
+@pytest.mark.parametrize("args,kwargs", [
+    ((1,), {}),
+    ((1, 2, 3, 4, 5), {}),
+    ((1, 2), {"a": 1}),
+    ((1, 2), {"x": 1}),
+    ((1,), {"c": 1}),
+])
+def test_gen_binder_errors(args, kwargs):
+    with pytest.raises(TypeError):
+        _gen_binder(_bound)(args, kwargs)
+
+
+async def test_cached_key_precomputed(cache, monkeypatch):
+    calls = 0
+
+    @cached(
+        exptime=1,
+        serialize=pickle.dumps,
+        deserialize=pickle.loads,
+        key=lambda a, b, **_: (a, b),
+    )
+    async def bound(a, b, cache, c=3, d=None):
+        nonlocal calls
+        calls += 1
+        return a, b, c, d
+
+    signatures = 0
+    signature = inspect.signature
+
+    def counted_signature(*args, **kwargs):
+        nonlocal signatures
+        signatures += 1
+        return signature(*args, **kwargs)
+
+    monkeypatch.setattr(inspect, "signature", counted_signature)
+    args = ("src-d/go-git", ["vmarkovtsev", "mcuadros"], cache)
+    for _ in range(10):
+        assert await bound(*args, d=None) == (*args[:2], 3, None)
+    assert calls == 1
+    # the signature is inspected once at decoration, not on every call
+    assert signatures == 0
+    full_name = "tests.test_cache.test_cached_key_precomputed.<locals>.bound"
+    key = gen_cache_key(full_name + "|" + "|".join(str(p) for p in args[:2]))
+    assert key in cache.mem
+
+
+async def test_cached_chunks(cache, monkeypatch):
+    monkeypatch.setattr(athenian.api.cache, "MAX_ITEM_SIZE", 100)
+    calls = 0
+
+    @cached(
+        exptime=1,
+        serialize=lambda s: s.encode(),
+        deserialize=lambda b: bytes(b).decode(),
+        key=lambda size, **_: (size,),
+    )
+    async def generate(size: int, cache: aiomcache.Client) -> str:
+        nonlocal calls
+        calls += 1
+        return "".join(chr(ord("a") + i % 26) for i in range(size))
+
+    name = "tests.test_cache.test_cached_chunks.<locals>.generate"
+    for size in (10, 100, 101, 1000):
+        value = await generate(size, cache)
+        assert await generate(size, cache) == value
+    assert calls == 4
+    # manifests and chunks: 1 + 1 + (1 + 2) + (1 + 10)
+    assert len(cache.mem) == 16
+    assert all(len(v[0]) <= 100 for v in cache.mem.values())
+    assert cache.metrics["oversized"].labels("athenian.api", name)._value.get() == 2
+    assert cache.metrics["hits"].labels("athenian.api", name)._value.get() == 4
+
+
+async def test_cached_chunks_missing(cache, monkeypatch):
+    monkeypatch.setattr(athenian.api.cache, "MAX_ITEM_SIZE", 10)
+    key = gen_cache_key("test")
+    await set_chunked(cache, key, b"0123456789" * 5, 1, "test")
+    assert len(cache.mem) == 6
+    assert await get_chunked(cache, key) == b"0123456789" * 5
+    # a newer generation replaces the manifest
+    await set_chunked(cache, key, b"9876543210" * 5, 1, "test")
+    assert len(cache.mem) == 11
+    assert await get_chunked(cache, key) == b"9876543210" * 5
+    # one chunk is evicted
+    chunk_key = next(k for k, v in cache.mem.items() if bytes(v[0]) == b"9876543210")
+    del cache.mem[chunk_key]
+    assert await get_chunked(cache, key) is None
+
+
+async def test_cached_single_flight(cache):
+    calls = 0
+
+    @cached(
+        exptime=1,
+        serialize=pickle.dumps,
+        deserialize=pickle.loads,
+        key=lambda x, **_: (x,),
+    )
+    async def compute(x: int, cache: aiomcache.Client) -> List[int]:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        if x < 0:
+            raise ValueError(x)
+        return [x]
+
+    name = "tests.test_cache.test_cached_single_flight.<locals>.compute"
+    results = await asyncio.gather(*(compute(1, cache) for _ in range(5)), compute(2, cache))
+    assert results == [[1]] * 5 + [[2]]
+    assert len({id(r) for r in results}) == 6
+    assert calls == 2
+    assert cache.metrics["coalesced"].labels("athenian.api", name)._value.get() == 4
+    assert cache.metrics["misses"].labels("athenian.api", name)._value.get() == 2
+    results = await asyncio.gather(*(compute(-1, cache) for _ in range(3)),
+                                   return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+    assert calls == 3
+    await asyncio.gather(*(compute(-1, cache) for _ in range(3)), return_exceptions=True)
+    assert calls == 4
+
+
+async def test_cached_single_flight_cancel(cache):
+    calls = 0
+
+    @cached(
+        exptime=1,
+        serialize=pickle.dumps,
+        deserialize=pickle.loads,
+        key=lambda **_: (),
+    )
+    async def compute(cache: aiomcache.Client) -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        return calls
+
+    leader = asyncio.ensure_future(compute(cache))
+    await asyncio.sleep(0.01)
+    follower = asyncio.ensure_future(compute(cache))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    # the follower becomes the leader
+    assert await follower == 2
+    assert leader.cancelled()
+
+
+async def test_cached_lease(cache, monkeypatch):
+    monkeypatch.setattr(athenian.api.cache, "LEASE_POLL_INTERVAL", 0.01)
+    calls = 0
+
+    async def compute(x: int, cache: aiomcache.Client) -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        if x < 0:
+            raise ValueError(x)
+        return x
+
+    # two decorations have separate single-flights, so they behave like two processes
+    replicas = [cached(
+        exptime=10,
+        serialize=pickle.dumps,
+        deserialize=pickle.loads,
+        key=lambda x, **_: (x,),
+        lease=1,
+    )(compute) for _ in range(2)]
+    name = "tests.test_cache.test_cached_lease.<locals>.compute"
+    assert await asyncio.gather(*(replica(1, cache) for replica in replicas)) == [1, 1]
+    assert calls == 1
+    assert cache.metrics["hits"].labels("athenian.api", name)._value.get() == 1
+    assert cache.metrics["misses"].labels("athenian.api", name)._value.get() == 1
+    # the lease is released
+    assert len(cache.mem) == 1
+    # the failed owner releases the lease and the other computes immediately
+    start = time.time()
+    results = await asyncio.gather(*(replica(-1, cache) for replica in replicas),
+                                   return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+    assert calls == 3
+    assert time.time() - start < 0.5
+    # the owner of the lease has died
+    await cache.add(_gen_lease_key(gen_cache_key(name + "|2")), b"1", 1)
+    start = time.time()
+    assert await replicas[0](2, cache) == 2
+    assert time.time() - start >= 1
+    assert calls == 4
+
+
+async def test_cached_stale_while_revalidate(cache):
+    calls = 0
+
+    @cached(
+        exptime=10,
+        serialize=pickle.dumps,
+        deserialize=pickle.loads,
+        key=lambda **_: (),
+        soft_exptime=1,
+    )
+    async def compute(cache: aiomcache.Client) -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        return calls
+
+    name = "tests.test_cache.test_cached_stale_while_revalidate.<locals>.compute"
+    assert await compute(cache) == 1
+    assert await compute(cache) == 1
+    await asyncio.sleep(1.1)
+    # the stale value is returned immediately and refreshed only once
+    start = time.time()
+    assert await compute(cache) == 1
+    assert await compute(cache) == 1
+    assert time.time() - start < 0.1
+    assert cache.metrics["stale"].labels("athenian.api", name)._value.get() == 2
+    await asyncio.sleep(0.2)
+    assert calls == 2
+    assert await compute(cache) == 2
+    assert cache.metrics["stale"].labels("athenian.api", name)._value.get() == 2
+
+
+async def test_cached_l1(cache):
+    gets = 0
+    get = cache.get
+
+    async def counted_get(*args, **kwargs):
+        nonlocal gets
+        gets += 1
+        return await get(*args, **kwargs)
+
+    cache.get = counted_get
+
+    @cached(
+        exptime=10,
+        serialize=lambda x: str(x).encode(),
+        deserialize=lambda b: int(bytes(b)),
+        key=lambda x, **_: (x,),
+        l1_size=2,
+        l1_ttl=0.5,
+    )
+    async def compute(x: int, cache: aiomcache.Client) -> int:
+        return x
+
+    name = "tests.test_cache.test_cached_l1.<locals>.compute"
+    for x in (1, 2, 1, 2, 1):
+        assert await compute(x, cache) == x
+    assert gets == 2
+    assert cache.metrics["l1_hits"].labels("athenian.api", name)._value.get() == 3
+    assert cache.metrics["l1_misses"].labels("athenian.api", name)._value.get() == 2
+    # 3 evicts 2
+    assert await compute(3, cache) == 3
+    assert await compute(1, cache) == 1
+    assert gets == 3
+    assert await compute(2, cache) == 2
+    assert gets == 4
+    assert cache.metrics["hits"].labels("athenian.api", name)._value.get() == 1
+    # the TTL expires
+    await asyncio.sleep(0.5)
+    assert await compute(2, cache) == 2
+    assert gets == 5
+    assert cache.metrics["hits"].labels("athenian.api", name)._value.get() == 2
+
+
+async def test_cached_batch(cache, monkeypatch):
+    monkeypatch.setattr(athenian.api.cache, "MAX_ITEM_SIZE", 10)
+    calls = []
+    multi_gets = 0
+    multi_get = cache.multi_get
+
+    async def counted_multi_get(*keys):
+        nonlocal multi_gets
+        multi_gets += 1
+        return await multi_get(*keys)
+
+    cache.multi_get = counted_multi_get
+
+    @cached_batch(
+        exptime=10,
+        serialize=lambda s: s.encode(),
+        deserialize=lambda b: bytes(b).decode(),
+        key=lambda x, suffix, **_: (x, suffix),
+        batch="xs",
+    )
+    async def compute(xs: List[int], suffix: str, cache: aiomcache.Client) -> List[str]:
+        calls.append(list(xs))
+        return ["%d%s" % (x, suffix) for x in xs]
+
+    name = "tests.test_cache.test_cached_batch.<locals>.compute"
+    assert await compute([1, 2, 1], "a", cache) == ["1a", "2a", "1a"]
+    assert calls == [[1, 2]]
+    assert multi_gets == 1
+    assert await compute([2, 3, 1], "a", cache) == ["2a", "3a", "1a"]
+    assert calls == [[1, 2], [3]]
+    assert multi_gets == 2
+    assert await compute([3, 2], "a", cache) == ["3a", "2a"]
+    assert await compute([2], "b", cache) == ["2b"]
+    assert calls == [[1, 2], [3], [2]]
+    assert await compute([], "a", cache) == []
+    assert await compute([1, 2], "a", None) == ["1a", "2a"]
+    assert len(calls) == 4
+    assert cache.metrics["hits"].labels("athenian.api", name)._value.get() == 4
+    assert cache.metrics["misses"].labels("athenian.api", name)._value.get() == 4
+    # the oversized values are split into several items
+    long = "x" * 15
+    assert await compute([4], long, cache) == ["4" + long]
+    assert await compute([4], long, cache) == ["4" + long]
+    assert len(calls) == 5
+    assert cache.metrics["oversized"].labels("athenian.api", name)._value.get() == 1
+
+
+async def test_cached_namespace(cache):
+    calls = 0
+
+    @cached(
+        exptime=100,
+        serialize=lambda x: str(x).encode(),
+        deserialize=lambda b: int(bytes(b)),
+        key=lambda x, **_: (x,),
+        namespace=lambda x, **_: "ns|%d" % (x % 2),
+    )
+    async def compute(x: int, cache: aiomcache.Client) -> int:
+        nonlocal calls
+        calls += 1
+        return x
+
+    @cached_batch(
+        exptime=100,
+        serialize=lambda x: str(x).encode(),
+        deserialize=lambda b: int(bytes(b)),
+        key=lambda x, **_: (x,),
+        batch="xs",
+        namespace=lambda x, **_: "ns|%d" % (x % 2),
+    )
+    async def compute_batch(xs: List[int], cache: aiomcache.Client) -> List[int]:
+        nonlocal calls
+        calls += len(xs)
+        return list(xs)
+
+    for x in (1, 2, 1, 2):
+        assert await compute(x, cache) == x
+    assert await compute_batch([1, 2, 3], cache) == [1, 2, 3]
+    assert await compute_batch([1, 2, 3], cache) == [1, 2, 3]
+    assert calls == 5
+    await bump_cache_namespace(cache, "ns|1")
+    await bump_cache_namespace(None, "ns|0")
+    assert await compute(2, cache) == 2
+    assert calls == 5
+    assert await compute(1, cache) == 1
+    assert calls == 6
+    assert await compute_batch([1, 2, 3], cache) == [1, 2, 3]
+    assert calls == 8
+    await bump_cache_namespace(cache, "ns|0")
+    assert await compute_batch([1, 2, 3], cache) == [1, 2, 3]
+    assert calls == 9
+
+
+async def test_cached_namespace_l1(cache, monkeypatch):
+    monkeypatch.setattr(athenian.api.cache, "NAMESPACE_VERSION_TTL", 0.5)
+    calls = 0
+
+    @cached(
+        exptime=100,
+        serialize=lambda x: str(x).encode(),
+        deserialize=lambda b: int(bytes(b)),
+        key=lambda x, **_: (x,),
+        l1_size=10,
+        l1_ttl=100,
+        namespace=lambda x, **_: "ns",
+    )
+    async def compute(x: int, cache: aiomcache.Client) -> int:
+        nonlocal calls
+        calls += 1
+        return x
+
+    assert await compute(1, cache) == 1
+    requests = 0
+    get = cache.get
+
+    async def counted_get(*args, **kwargs):
+        nonlocal requests
+        requests += 1
+        return await get(*args, **kwargs)
+
+    monkeypatch.setattr(cache, "get", counted_get)
+    # both the value and the namespace version are in memory
+    assert await compute(1, cache) == 1
+    assert requests == 0
+    # this process notices its own bumps immediately
+    await bump_cache_namespace(cache, "ns")
+    assert await compute(1, cache) == 1
+    assert calls == 2
+    # and the bumps of the other processes after the TTL
+    await cache.set(athenian.api.cache._gen_namespace_key("ns"), b"x" * 8)
+    assert await compute(1, cache) == 1
+    assert calls == 2
+    await asyncio.sleep(0.5)
+    assert await compute(1, cache) == 1
+    assert calls == 3